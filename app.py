@@ -2,6 +2,9 @@ from math import e
 from PIL import Image
 import streamlit as st
 import services.supabase_client as supabase_client
+# Importado aqui para que a thread de envio da fila de salvamento comece junto
+# com o servidor e reenvie o que ficou pendente, sem esperar a página de geração
+import services.fila_salvamento
 
 im = Image.open("images/favicon.png")
 st.set_page_config(
@@ -10,7 +13,11 @@ st.set_page_config(
     layout="wide"
 )
 
-supabase = supabase_client.get_supabase_connection()
+# Cliente exclusivo da sessão do navegador (o login altera o estado de autenticação
+# do cliente, por isso ele não pode ser o cliente compartilhado do processo)
+if 'supabase_sessao' not in st.session_state:
+    st.session_state.supabase_sessao = supabase_client.criar_cliente_sessao()
+supabase = st.session_state.supabase_sessao
 
 # Inicialização das variáveis de sessão
 if 'logged_in' not in st.session_state:
@@ -102,6 +109,11 @@ def main_page():
         title="Gerar Questões",
         icon=":material/convert_to_text:",
     )
+    busca = st.Page(
+        "views/busca.py",
+        title="Buscar Questões",
+        icon=":material/search:",
+    )
     usuarios = st.Page(
         "views/usuarios.py",
         title="Gerenciar Usuários",
@@ -115,7 +127,7 @@ def main_page():
         logout_user, 
         title="Sair", 
         icon=":material/logout:")
-    user_pages = [dashboard, extracao]
+    user_pages = [dashboard, extracao, busca]
     admin_pages = [usuarios]
     account_pages = [settings, logout_page]
     st.logo("images/logo_gabarita.png")
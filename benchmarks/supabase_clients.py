@@ -0,0 +1,58 @@
+"""
+Benchmark do custo por chamada de criar um cliente Supabase novo (como era feito
+em get_supabase_connection) versus reaproveitar o cliente compartilhado.
+
+Uso, na raiz do projeto e com o .streamlit/secrets.toml configurado:
+    python -m benchmarks.supabase_clients [--repeticoes 20] [--sem-rede]
+
+Com --sem-rede, mede apenas a criação do cliente; sem a opção, mede também uma
+consulta simples à tabela profiles (criação + handshake TLS + requisição).
+"""
+import argparse
+import statistics
+import time
+from supabase import create_client
+import services.supabase_client as supabase_client
+
+
+def medir(funcao, repeticoes):
+    """Executa a função várias vezes e retorna as durações em milissegundos"""
+    duracoes = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        duracoes.append((time.perf_counter() - inicio) * 1000)
+    return duracoes
+
+
+def exibir(nome, duracoes):
+    print(f"{nome:<40} mediana {statistics.median(duracoes):8.1f} ms   máx {max(duracoes):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--sem-rede", action="store_true")
+    args = parser.parse_args()
+
+    url, chave = supabase_client.SUPABASE_URL, supabase_client.SUPABASE_KEY
+    compartilhado = supabase_client.get_supabase_connection()
+
+    novo = medir(lambda: create_client(url, chave), args.repeticoes)
+    reaproveitado = medir(lambda: supabase_client.get_supabase_connection(), args.repeticoes)
+    exibir("criação: cliente novo", novo)
+    exibir("criação: cliente compartilhado", reaproveitado)
+
+    if not args.sem_rede:
+        consulta = lambda cliente: cliente.table("profiles").select("id").limit(1).execute()
+        # Aquecer a conexão do cliente compartilhado
+        consulta(compartilhado)
+        novo = medir(lambda: consulta(create_client(url, chave)), args.repeticoes)
+        reaproveitado = medir(lambda: consulta(supabase_client.get_supabase_connection()), args.repeticoes)
+        exibir("consulta: cliente novo", novo)
+        exibir("consulta: cliente compartilhado", reaproveitado)
+        print(f"{'economia por chamada (mediana)':<40} {statistics.median(novo) - statistics.median(reaproveitado):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Teste de ponta a ponta do modo em lote (gerar_lista_questoes_lote) sem a OpenAI:
+um cliente local imita a Batch API (envio do arquivo JSONL, criação do lote,
+consultas de status e arquivos de saída e de erros) e o script confere se as
+respostas voltam para os itens certos pelo custom_id, com os metadados, e se
+as linhas com falha viram questões com erro. Também confere a retomada de um
+lote já enviado (ids_lotes), que não pode criar um lote novo.
+
+Uso, na raiz do projeto e com o .streamlit/secrets.toml configurado (nenhuma
+chamada de rede é feita):
+    python -m scripts.testar_lote_local
+"""
+import json
+import random
+import sys
+import types
+import services.openai_client as openai_client
+
+
+class ClienteLoteLocal:
+    """
+    Substituto local do cliente da OpenAI para a Batch API. Guarda os arquivos
+    enviados em memória, conclui cada lote depois de algumas consultas e gera
+    as respostas a partir do corpo de cada requisição.
+    Args:
+        responder (callable): Função responder(custom_id, corpo) que retorna o
+            conteúdo da mensagem (str) ou levanta uma exceção para simular uma falha
+        consultas_ate_concluir (int, optional): Consultas de status antes de o lote terminar
+        ids_com_erro (set, optional): custom_ids que vão para o arquivo de erros
+    """
+
+    def __init__(self, responder, consultas_ate_concluir=2, ids_com_erro=()):
+        self.responder = responder
+        self.consultas_ate_concluir = consultas_ate_concluir
+        self.ids_com_erro = set(ids_com_erro)
+        self.arquivos = {}
+        self.lotes = {}
+        # Mesma interface do SDK: cliente.files.* e cliente.batches.*
+        self.files = types.SimpleNamespace(create=self._criar_arquivo, content=self._conteudo_arquivo)
+        self.batches = types.SimpleNamespace(create=self._criar_lote, retrieve=self._consultar_lote)
+
+    def _criar_arquivo(self, file, purpose):
+        id_arquivo = f"file-{len(self.arquivos) + 1}"
+        self.arquivos[id_arquivo] = file[1].decode('utf-8')
+        return types.SimpleNamespace(id=id_arquivo, purpose=purpose)
+
+    def _conteudo_arquivo(self, id_arquivo):
+        return types.SimpleNamespace(text=self.arquivos[id_arquivo])
+
+    def _criar_lote(self, input_file_id, endpoint, completion_window):
+        id_lote = f"batch-{len(self.lotes) + 1}"
+        self.lotes[id_lote] = {"entrada": input_file_id, "consultas": 0}
+        return types.SimpleNamespace(id=id_lote, status="validating", request_counts=None)
+
+    def _consultar_lote(self, id_lote):
+        lote = self.lotes[id_lote]
+        lote["consultas"] += 1
+        requisicoes = [json.loads(linha) for linha in self.arquivos[lote["entrada"]].splitlines()]
+        total = len(requisicoes)
+        if lote["consultas"] < self.consultas_ate_concluir:
+            contagem = types.SimpleNamespace(total=total, completed=0, failed=0)
+            return types.SimpleNamespace(id=id_lote, status="in_progress", request_counts=contagem,
+                                         output_file_id=None, error_file_id=None)
+        if "saida" not in lote:
+            saida, erros = [], []
+            for requisicao in requisicoes:
+                custom_id = requisicao["custom_id"]
+                if custom_id in self.ids_com_erro:
+                    erros.append({"custom_id": custom_id, "response": None,
+                                  "error": {"code": "invalid_request", "message": "requisição rejeitada"}})
+                    continue
+                try:
+                    conteudo = self.responder(custom_id, requisicao["body"])
+                    resposta = {"status_code": 200, "body": {"choices": [{"message": {"content": conteudo}}]}}
+                except Exception as e:
+                    resposta = {"status_code": 500, "body": {"error": {"message": str(e)}}}
+                saida.append({"custom_id": custom_id, "response": resposta, "error": None})
+            # A Batch API não garante a ordem das linhas de saída
+            random.shuffle(saida)
+            lote["saida"] = self._guardar(saida)
+            lote["erros"] = self._guardar(erros) if erros else None
+            lote["contagem"] = types.SimpleNamespace(total=total, completed=len(saida), failed=len(erros))
+        return types.SimpleNamespace(id=id_lote, status="completed", request_counts=lote["contagem"],
+                                     output_file_id=lote["saida"], error_file_id=lote["erros"])
+
+    def _guardar(self, registros):
+        id_arquivo = f"file-{len(self.arquivos) + 1}"
+        self.arquivos[id_arquivo] = "\n".join(json.dumps(registro, ensure_ascii=False) for registro in registros)
+        return id_arquivo
+
+
+def responder_com_assunto(custom_id, corpo):
+    """Gera uma questão cujo enunciado contém o assunto do prompt; "falha" simula um erro 500"""
+    prompt = corpo["messages"][-1]["content"]
+    if "falha" in prompt:
+        raise Exception("erro simulado no servidor")
+    assunto = prompt.split("Assunto:")[1].splitlines()[0].strip() if "Assunto:" in prompt else prompt
+    campos = ["alternativa1", "alternativa2", "alternativa3", "alternativa4", "alternativa5", "gabarito", "resolucao"]
+    return json.dumps({"enunciado": f"Questão sobre {assunto}", **{campo: "x" for campo in campos}}, ensure_ascii=False)
+
+
+def main():
+    itens = [
+        {"codigo": indice, "materia": "Biologia", "tema": "Células", "subtema": "Divisão", "assunto": assunto}
+        for indice, assunto in enumerate(["mitose", "meiose", "falha", "citocinese", "mitose"])
+    ]
+    # Não ler nem gravar o cache de questões real
+    openai_client.cache = None
+    # O custom_id "1" (meiose) vai para o arquivo de erros
+    cliente = ClienteLoteLocal(responder_com_assunto, ids_com_erro={"1"})
+    atualizacoes = []
+    ids_enviados = []
+    questoes = openai_client.gerar_lista_questoes_lote(
+        itens, "médio", intervalo_consulta=0, cliente=cliente,
+        ao_atualizar=lambda lote: atualizacoes.append(lote.status),
+        ao_criar_lotes=ids_enviados.extend
+    )
+
+    falhas = []
+    def conferir(condicao, mensagem):
+        print(f"{'ok   ' if condicao else 'FALHA'} {mensagem}")
+        if not condicao:
+            falhas.append(mensagem)
+
+    conferir(len(questoes) == len(itens), "uma questão por item")
+    conferir([q["metadados"]["codigo"] for q in questoes] == [item["codigo"] for item in itens],
+             "metadados na ordem dos itens")
+    for indice in (0, 3, 4):
+        conferir(itens[indice]["assunto"] in questoes[indice].get("enunciado", ""),
+                 f"item {indice} recebeu a resposta do seu custom_id")
+    conferir("erro" in questoes[1] and "rejeitada" in questoes[1]["erro"], "linha do arquivo de erros vira questão com erro")
+    conferir("erro" in questoes[2] and "500" in questoes[2]["erro"], "resposta com status 500 vira questão com erro")
+    conferir(atualizacoes[-1] == "completed" and len(atualizacoes) >= 2, "status consultado até o lote terminar")
+    conferir(ids_enviados == list(cliente.lotes), "ao_criar_lotes recebe os IDs dos lotes enviados")
+
+    # Retomar o mesmo lote não cria outro
+    lotes_antes = len(cliente.lotes)
+    retomadas = openai_client.gerar_lista_questoes_lote(
+        itens, "médio", intervalo_consulta=0, cliente=cliente, ids_lotes=ids_enviados
+    )
+    conferir(len(cliente.lotes) == lotes_antes, "retomada não cria lote novo")
+    conferir([q.get("enunciado") for q in retomadas] == [q.get("enunciado") for q in questoes],
+             "retomada devolve as mesmas questões")
+
+    if falhas:
+        print(f"{len(falhas)} verificações falharam")
+        sys.exit(1)
+    print("Modo em lote verificado de ponta a ponta")
+
+
+if __name__ == "__main__":
+    main()
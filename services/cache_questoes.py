@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def chave_questao(materia, tema, subtema, assunto, dificuldade, modelo, versao_prompt, ocorrencia=0):
+    """
+    Calcula a chave do cache para uma questão.
+    Args:
+        materia, tema, subtema, assunto (str): Metadados do item
+        dificuldade (str): Nível de dificuldade
+        modelo (str): Modelo da OpenAI usado na geração
+        versao_prompt (str): Versão do template do prompt
+        ocorrencia (int, optional): Quantas vezes o mesmo item já apareceu antes na planilha,
+            para que linhas repetidas recebam questões diferentes
+    Returns:
+        str: Hash SHA-256 em hexadecimal
+    """
+    partes = [materia, tema, subtema, assunto, dificuldade, modelo, versao_prompt]
+    # A primeira ocorrência mantém a chave de antes, preservando o que já está no cache
+    if ocorrencia:
+        partes.append(ocorrencia)
+    texto = json.dumps([str(p).strip() for p in partes], ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class CacheQuestoes:
+    """
+    Cache em disco (SQLite) de questões geradas, com expiração por tempo (TTL)
+    e descarte das entradas menos usadas recentemente (LRU) acima de um limite.
+    """
+
+    def __init__(self, caminho, ttl_segundos=30 * 24 * 3600, max_entradas=50000):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.falhas = 0
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS questoes (
+                chave TEXT PRIMARY KEY,
+                questao TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                acessado_em REAL NOT NULL
+            )
+            """
+        )
+        self._conexao.execute("CREATE INDEX IF NOT EXISTS idx_questoes_acessado_em ON questoes (acessado_em)")
+        self._conexao.commit()
+
+    def obter(self, chave):
+        """
+        Busca uma questão no cache.
+        Args:
+            chave (str): Chave calculada por chave_questao
+        Returns:
+            dict: Questão armazenada, ou None se ausente ou expirada
+        """
+        agora = time.time()
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT questao, criado_em FROM questoes WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or agora - linha[1] > self.ttl_segundos:
+                if linha is not None:
+                    self._conexao.execute("DELETE FROM questoes WHERE chave = ?", (chave,))
+                    self._conexao.commit()
+                self.falhas += 1
+                return None
+            self._conexao.execute("UPDATE questoes SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self._conexao.commit()
+            self.acertos += 1
+        return json.loads(linha[0])
+
+    def salvar(self, chave, questao):
+        """
+        Armazena (ou substitui) uma questão no cache e descarta as entradas
+        menos usadas se o limite for ultrapassado.
+        Args:
+            chave (str): Chave calculada por chave_questao
+            questao (dict): Questão gerada (sem metadados)
+        """
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO questoes (chave, questao, criado_em, acessado_em) VALUES (?, ?, ?, ?)",
+                (chave, json.dumps(questao, ensure_ascii=False), agora, agora)
+            )
+            self._conexao.execute(
+                """
+                DELETE FROM questoes WHERE chave IN (
+                    SELECT chave FROM questoes ORDER BY acessado_em DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entradas,)
+            )
+            self._conexao.commit()
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do cache.
+        Returns:
+            dict: Acertos, falhas e número de entradas armazenadas
+        """
+        with self._lock:
+            entradas = self._conexao.execute("SELECT COUNT(*) FROM questoes").fetchone()[0]
+        return {"acertos": self.acertos, "falhas": self.falhas, "entradas": entradas}
@@ -0,0 +1,217 @@
+import streamlit as st
+import json
+import os
+import sqlite3
+import threading
+import time
+from services.supabase_client import salvar_questoes_em_lote
+from services.retry import erro_supabase_recuperavel, tempo_espera
+
+# Fila local (SQLite) pela qual passam todas as questões aprovadas antes de irem
+# para o Supabase: o salvamento na interface só grava aqui e retorna, e uma
+# thread em segundo plano envia as questões em blocos, com backoff quando o
+# Supabase está lento ou fora do ar. Como os salvamentos são idempotentes (hash
+# de conteúdo), reenviar uma questão já salva não a duplica. Falhas transitórias
+# (Supabase fora do ar, timeouts) são repetidas indefinidamente; só questões
+# rejeitadas pelo banco várias vezes saem da fila e vão para a tabela falhas, de
+# onde o usuário pode reenviá-las ou descartá-las.
+
+_caminho_fila = st.secrets.get("FILA_SALVAMENTO_ARQUIVO", ".cache/fila_salvamento.sqlite3")
+if os.path.dirname(_caminho_fila):
+    os.makedirs(os.path.dirname(_caminho_fila), exist_ok=True)
+
+# Número máximo de questões enviadas a cada rodada
+TAMANHO_BLOCO_ENVIO = int(st.secrets.get("FILA_SALVAMENTO_TAMANHO_BLOCO", 500))
+# Espera máxima entre novas tentativas de uma questão, em segundos
+ESPERA_MAXIMA = float(st.secrets.get("FILA_SALVAMENTO_ESPERA_MAXIMA", 300))
+# Número de rejeições pelo banco (erros não transitórios) antes de uma questão ser dada como falha
+MAX_TENTATIVAS = int(st.secrets.get("FILA_SALVAMENTO_MAX_TENTATIVAS", 10))
+
+_lock = threading.Lock()
+_novas_questoes = threading.Event()
+_conexao = sqlite3.connect(_caminho_fila, check_same_thread=False)
+_conexao.execute("PRAGMA journal_mode=WAL")
+_conexao.execute(
+    """
+    CREATE TABLE IF NOT EXISTS pendentes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        questao TEXT NOT NULL,
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        rejeicoes INTEGER NOT NULL DEFAULT 0,
+        proxima_tentativa REAL NOT NULL,
+        erro TEXT,
+        criado_em REAL NOT NULL
+    )
+    """
+)
+# Filas criadas antes da contagem de rejeições
+if "rejeicoes" not in {coluna[1] for coluna in _conexao.execute("PRAGMA table_info(pendentes)")}:
+    _conexao.execute("ALTER TABLE pendentes ADD COLUMN rejeicoes INTEGER NOT NULL DEFAULT 0")
+_conexao.execute(
+    """
+    CREATE TABLE IF NOT EXISTS falhas (
+        id INTEGER PRIMARY KEY,
+        user_id TEXT,
+        questao TEXT NOT NULL,
+        tentativas INTEGER NOT NULL,
+        erro TEXT,
+        criado_em REAL NOT NULL,
+        falhou_em REAL NOT NULL
+    )
+    """
+)
+_conexao.execute("CREATE INDEX IF NOT EXISTS idx_pendentes_proxima_tentativa ON pendentes (proxima_tentativa)")
+_conexao.execute("CREATE INDEX IF NOT EXISTS idx_falhas_user_id ON falhas (user_id)")
+_conexao.commit()
+
+def enfileirar_questoes(questoes, user_id=None):
+    """
+    Grava questões aprovadas na fila local para envio ao banco de dados.
+    Args:
+        questoes (list): Lista de questões
+        user_id (str, optional): ID do usuário que está salvando
+    Returns:
+        int: Número de questões enfileiradas
+    """
+    agora = time.time()
+    with _lock:
+        _conexao.executemany(
+            "INSERT INTO pendentes (user_id, questao, proxima_tentativa, criado_em) VALUES (?, ?, ?, ?)",
+            [(user_id, json.dumps(questao, ensure_ascii=False, default=str), agora, agora) for questao in questoes]
+        )
+        _conexao.commit()
+    _novas_questoes.set()
+    return len(questoes)
+
+def estado_fila(user_id=None):
+    """
+    Retorna a situação das questões de um usuário que ainda não chegaram ao banco.
+    Args:
+        user_id (str, optional): ID do usuário
+    Returns:
+        dict: 'pendentes' (int) e 'ultimo_erro' (str ou None) das questões ainda
+            na fila, e 'falhas' (int) e 'erro_falhas' (str ou None) das que
+            esgotaram as tentativas
+    """
+    with _lock:
+        pendentes = _conexao.execute(
+            "SELECT COUNT(*) FROM pendentes WHERE user_id IS ?", (user_id,)
+        ).fetchone()[0]
+        linha = _conexao.execute(
+            "SELECT erro FROM pendentes WHERE user_id IS ? AND erro IS NOT NULL ORDER BY proxima_tentativa DESC LIMIT 1",
+            (user_id,)
+        ).fetchone()
+        falhas = _conexao.execute(
+            "SELECT COUNT(*) FROM falhas WHERE user_id IS ?", (user_id,)
+        ).fetchone()[0]
+        linha_falha = _conexao.execute(
+            "SELECT erro FROM falhas WHERE user_id IS ? ORDER BY falhou_em DESC LIMIT 1", (user_id,)
+        ).fetchone()
+    return {
+        "pendentes": pendentes,
+        "ultimo_erro": linha[0] if linha else None,
+        "falhas": falhas,
+        "erro_falhas": linha_falha[0] if linha_falha else None
+    }
+
+def reenviar_falhas(user_id=None):
+    """
+    Devolve à fila, com as tentativas zeradas, as questões de um usuário que falharam.
+    Args:
+        user_id (str, optional): ID do usuário
+    Returns:
+        int: Número de questões devolvidas à fila
+    """
+    agora = time.time()
+    with _lock:
+        cursor = _conexao.execute(
+            "INSERT INTO pendentes (user_id, questao, proxima_tentativa, criado_em) "
+            "SELECT user_id, questao, ?, criado_em FROM falhas WHERE user_id IS ?",
+            (agora, user_id)
+        )
+        _conexao.execute("DELETE FROM falhas WHERE user_id IS ?", (user_id,))
+        _conexao.commit()
+    _novas_questoes.set()
+    return cursor.rowcount
+
+def descartar_falhas(user_id=None):
+    """
+    Apaga as questões de um usuário que falharam, sem salvá-las.
+    Args:
+        user_id (str, optional): ID do usuário
+    Returns:
+        int: Número de questões descartadas
+    """
+    with _lock:
+        cursor = _conexao.execute("DELETE FROM falhas WHERE user_id IS ?", (user_id,))
+        _conexao.commit()
+    return cursor.rowcount
+
+def _enviar_pendentes():
+    """
+    Envia ao banco as questões cuja próxima tentativa já venceu.
+    Returns:
+        float: Segundos até a próxima questão ficar pronta para envio, ou None se a fila estiver vazia
+    """
+    agora = time.time()
+    with _lock:
+        linhas = _conexao.execute(
+            "SELECT id, user_id, questao, tentativas, rejeicoes FROM pendentes WHERE proxima_tentativa <= ? ORDER BY id LIMIT ?",
+            (agora, TAMANHO_BLOCO_ENVIO)
+        ).fetchall()
+
+    # Agrupar por usuário, já que salvar_questoes_em_lote recebe um único user_id
+    por_usuario = {}
+    for linha in linhas:
+        por_usuario.setdefault(linha[1], []).append(linha)
+    for user_id, grupo in por_usuario.items():
+        try:
+            resultados = salvar_questoes_em_lote([json.loads(linha[2]) for linha in grupo], user_id)
+        except Exception as e:
+            resultados = [{"sucesso": False, "erro": str(e), "recuperavel": erro_supabase_recuperavel(e)} for _ in grupo]
+        salvas = [(linha[0],) for linha, resultado in zip(grupo, resultados) if resultado["sucesso"]]
+        # Só rejeições contam para o limite; falhas transitórias são repetidas sempre,
+        # com a espera limitada a ESPERA_MAXIMA
+        falhas = [
+            (linha, resultado["erro"], linha[4] + (0 if resultado.get("recuperavel", True) else 1))
+            for linha, resultado in zip(grupo, resultados) if not resultado["sucesso"]
+        ]
+        reenviar = [
+            (linha[3] + 1, rejeicoes, time.time() + tempo_espera(min(linha[3], 30), base=2.0, maximo=ESPERA_MAXIMA), erro, linha[0])
+            for linha, erro, rejeicoes in falhas if rejeicoes < MAX_TENTATIVAS
+        ]
+        esgotadas = [(linha[3] + 1, erro, time.time(), linha[0]) for linha, erro, rejeicoes in falhas if rejeicoes >= MAX_TENTATIVAS]
+        if falhas:
+            print(f"{len(falhas)} questões não foram salvas ({len(esgotadas)} rejeitadas em definitivo): {falhas[0][1]}")
+        with _lock:
+            _conexao.executemany("DELETE FROM pendentes WHERE id = ?", salvas)
+            _conexao.executemany(
+                "UPDATE pendentes SET tentativas = ?, rejeicoes = ?, proxima_tentativa = ?, erro = ? WHERE id = ?", reenviar
+            )
+            _conexao.executemany(
+                "INSERT INTO falhas (user_id, questao, tentativas, erro, criado_em, falhou_em) "
+                "SELECT user_id, questao, ?, ?, criado_em, ? FROM pendentes WHERE id = ?",
+                esgotadas
+            )
+            _conexao.executemany("DELETE FROM pendentes WHERE id = ?", [(linha[-1],) for linha in esgotadas])
+            _conexao.commit()
+
+    with _lock:
+        proxima = _conexao.execute("SELECT MIN(proxima_tentativa) FROM pendentes").fetchone()[0]
+    return None if proxima is None else max(0.0, proxima - time.time())
+
+def _esvaziar_fila():
+    """Laço da thread de envio: envia as questões prontas e dorme até a próxima ou até chegarem novas"""
+    while True:
+        # Limpar antes de enviar, para não perder um aviso dado durante o envio
+        _novas_questoes.clear()
+        try:
+            espera = _enviar_pendentes()
+        except Exception as e:
+            print(f"Erro ao esvaziar a fila de salvamento: {str(e)}")
+            espera = ESPERA_MAXIMA
+        if espera is None or espera > 0:
+            _novas_questoes.wait(timeout=espera)
+
+threading.Thread(target=_esvaziar_fila, name="fila-salvamento", daemon=True).start()
@@ -0,0 +1,287 @@
+import streamlit as st
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from services.openai_client import (
+    gerar_lista_questoes, gerar_lista_questoes_agrupadas, gerar_lista_questoes_lote, numerar_ocorrencias
+)
+from services.metricas import lote_atual
+
+# Jobs de geração executados fora da execução do script do Streamlit: continuam
+# rodando após reruns, troca de página ou queda da conexão do navegador, e o
+# status e as questões de cada job ficam gravados em disco.
+
+_caminho_jobs = st.secrets.get("JOBS_ARQUIVO", ".cache/jobs.sqlite3")
+if os.path.dirname(_caminho_jobs):
+    os.makedirs(os.path.dirname(_caminho_jobs), exist_ok=True)
+
+_lock = threading.Lock()
+_conexao = sqlite3.connect(_caminho_jobs, check_same_thread=False)
+_conexao.execute("PRAGMA journal_mode=WAL")
+_conexao.execute(
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        status TEXT NOT NULL,
+        parametros TEXT NOT NULL,
+        itens TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        concluidas INTEGER NOT NULL DEFAULT 0,
+        erro TEXT,
+        criado_em REAL NOT NULL,
+        atualizado_em REAL NOT NULL
+    )
+    """
+)
+_conexao.execute(
+    """
+    CREATE TABLE IF NOT EXISTS job_questoes (
+        job_id TEXT NOT NULL,
+        indice INTEGER NOT NULL,
+        questao TEXT NOT NULL,
+        PRIMARY KEY (job_id, indice)
+    )
+    """
+)
+_conexao.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user_id ON jobs (user_id, criado_em)")
+_conexao.commit()
+
+# Número de jobs executados ao mesmo tempo (cada job já paraleliza suas chamadas à API)
+_executor = ThreadPoolExecutor(
+    max_workers=int(st.secrets.get("JOBS_MAX_SIMULTANEOS", 2)),
+    thread_name_prefix="job-geracao"
+)
+# Jobs da Batch API passam horas apenas consultando o status do lote, então rodam
+# em um executor próprio para não ocupar as vagas dos jobs de geração direta
+_executor_lotes = ThreadPoolExecutor(
+    max_workers=int(st.secrets.get("JOBS_MAX_LOTES_SIMULTANEOS", 8)),
+    thread_name_prefix="job-lote"
+)
+
+def _submeter_job(job_id, parametros):
+    """Coloca um job na fila do executor adequado ao seu modo de geração"""
+    executor = _executor_lotes if parametros.get("modo_lote") else _executor
+    executor.submit(_executar_job, job_id)
+
+def _executar_sql(sql, parametros=()):
+    """Executa um comando de escrita no banco de jobs"""
+    with _lock:
+        _conexao.execute(sql, parametros)
+        _conexao.commit()
+
+def _atualizar_job(job_id, **campos):
+    """Atualiza campos de um job"""
+    campos["atualizado_em"] = time.time()
+    atribuicoes = ", ".join(f"{campo} = ?" for campo in campos)
+    _executar_sql(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), job_id))
+
+def _salvar_questao_job(job_id, indice, questao):
+    """Grava uma questão concluída e atualiza a contagem do job"""
+    with _lock:
+        _conexao.execute(
+            "INSERT OR REPLACE INTO job_questoes (job_id, indice, questao) VALUES (?, ?, ?)",
+            (job_id, indice, json.dumps(questao, ensure_ascii=False, default=str))
+        )
+        _conexao.execute(
+            "UPDATE jobs SET concluidas = (SELECT COUNT(*) FROM job_questoes WHERE job_id = ?), atualizado_em = ? WHERE id = ?",
+            (job_id, time.time(), job_id)
+        )
+        _conexao.commit()
+
+def _executar_job(job_id):
+    """
+    Executa um job de geração, gerando apenas os itens que ainda não têm questão
+    gravada (o que permite retomar jobs interrompidos). Jobs da Batch API cujos
+    lotes já foram enviados voltam a acompanhar os mesmos lotes, sem criar outros.
+    """
+    job = obter_job(job_id)
+    if job is None:
+        return
+    parametros = job["parametros"]
+    itens = job["itens"]
+    feitos = set(obter_questoes_job(job_id))
+    pendentes = [indice for indice in range(len(itens)) if indice not in feitos]
+    if not pendentes:
+        _atualizar_job(job_id, status="concluido")
+        return
+    if parametros.get("ids_lotes"):
+        # Os lotes foram montados com os itens pendentes na época do envio
+        pendentes = parametros["indices_lote"]
+    _atualizar_job(job_id, status="em_andamento")
+    # Associar as métricas das chamadas à API a este job
+    lote_atual.set(job_id)
+    try:
+        lista = [itens[indice] for indice in pendentes]
+        # Numerar as repetições sobre a planilha inteira, não só sobre os pendentes
+        todas_ocorrencias = numerar_ocorrencias(itens)
+        ocorrencias = [todas_ocorrencias[indice] for indice in pendentes]
+        # O índice recebido pelos callbacks é relativo à lista de pendentes
+        def ao_concluir(posicao, questao):
+            _salvar_questao_job(job_id, pendentes[posicao], questao)
+        if parametros.get("modo_lote"):
+            feitos_fora_do_lote = len(feitos.difference(pendentes))
+            def ao_atualizar(lote):
+                if lote.request_counts and lote.request_counts.total:
+                    _atualizar_job(job_id, concluidas=feitos_fora_do_lote + lote.request_counts.completed + lote.request_counts.failed)
+            # Guardar os IDs dos lotes assim que enviados, para retomar a consulta se o processo reiniciar
+            def ao_criar_lotes(ids_lotes):
+                _atualizar_job(job_id, parametros=json.dumps({**parametros, "ids_lotes": ids_lotes, "indices_lote": pendentes}))
+            questoes = gerar_lista_questoes_lote(
+                lista, parametros["dificuldade"], ao_atualizar=ao_atualizar, ocorrencias=ocorrencias,
+                ids_lotes=parametros.get("ids_lotes"), ao_criar_lotes=ao_criar_lotes
+            )
+            for posicao, questao in enumerate(questoes):
+                ao_concluir(posicao, questao)
+        elif parametros.get("itens_por_chamada", 1) > 1:
+            gerar_lista_questoes_agrupadas(
+                lista, parametros["dificuldade"],
+                itens_por_chamada=parametros["itens_por_chamada"],
+                ao_concluir=ao_concluir, ocorrencias=ocorrencias
+            )
+        else:
+            gerar_lista_questoes(lista, parametros["dificuldade"], ao_concluir=ao_concluir, ocorrencias=ocorrencias)
+        _atualizar_job(job_id, status="concluido")
+    except Exception as e:
+        print(f"Erro ao executar job {job_id}: {str(e)}")
+        _atualizar_job(job_id, status="erro", erro=str(e))
+
+def submeter_geracao(itens, dificuldade, modo_lote=False, itens_por_chamada=1, user_id=None, existentes=None):
+    """
+    Cria um job de geração de questões e o coloca na fila de execução.
+    Args:
+        itens (list): Itens (linhas do arquivo) para os quais gerar questões
+        dificuldade (str): Nível de dificuldade das questões
+        modo_lote (bool, optional): Se True, usa a Batch API
+        itens_por_chamada (int, optional): Número de itens agrupados em cada chamada à API
+        user_id (str, optional): ID do usuário dono do job
+        existentes (dict, optional): Questões já prontas (ex.: reaproveitadas do
+            banco), indexadas pela posição do item; só os demais itens são gerados
+    Returns:
+        str: ID do job criado
+    """
+    job_id = uuid.uuid4().hex
+    agora = time.time()
+    parametros = {"dificuldade": dificuldade, "modo_lote": modo_lote, "itens_por_chamada": itens_por_chamada}
+    existentes = existentes or {}
+    with _lock:
+        _conexao.execute(
+            "INSERT INTO jobs (id, user_id, status, parametros, itens, total, concluidas, criado_em, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user_id, "pendente", json.dumps(parametros),
+             json.dumps(itens, ensure_ascii=False, default=str), len(itens), len(existentes), agora, agora)
+        )
+        _conexao.executemany(
+            "INSERT INTO job_questoes (job_id, indice, questao) VALUES (?, ?, ?)",
+            [(job_id, indice, json.dumps(questao, ensure_ascii=False, default=str)) for indice, questao in existentes.items()]
+        )
+        _conexao.commit()
+    _submeter_job(job_id, parametros)
+    return job_id
+
+def obter_job(job_id, com_itens=True):
+    """
+    Retorna o status de um job.
+    Args:
+        job_id (str): ID do job
+        com_itens (bool, optional): Se False, não lê a lista de itens (mais leve para
+            consultas frequentes de progresso)
+    Returns:
+        dict: Dados do job (status, total, concluidas, erro, parametros e, se pedido,
+            itens), ou None se não existir
+    """
+    with _lock:
+        linha = _conexao.execute(
+            f"SELECT id, user_id, status, parametros, total, concluidas, erro, criado_em{', itens' if com_itens else ''} FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+    if linha is None:
+        return None
+    job = {
+        "id": linha[0],
+        "user_id": linha[1],
+        "status": linha[2],
+        "parametros": json.loads(linha[3]),
+        "total": linha[4],
+        "concluidas": linha[5],
+        "erro": linha[6],
+        "criado_em": linha[7]
+    }
+    if com_itens:
+        job["itens"] = json.loads(linha[8])
+    return job
+
+def obter_questoes_job(job_id, ultimas=None):
+    """
+    Retorna as questões já concluídas de um job.
+    Args:
+        job_id (str): ID do job
+        ultimas (int, optional): Se informado, retorna apenas as últimas questões
+            concluídas, da mais recente para a mais antiga
+    Returns:
+        dict: Questões indexadas pela posição do item no job
+    """
+    with _lock:
+        if ultimas is None:
+            linhas = _conexao.execute(
+                "SELECT indice, questao FROM job_questoes WHERE job_id = ? ORDER BY indice", (job_id,)
+            ).fetchall()
+        else:
+            # Cada gravação (INSERT OR REPLACE) recebe um rowid novo, na ordem de conclusão
+            linhas = _conexao.execute(
+                "SELECT indice, questao FROM job_questoes WHERE job_id = ? ORDER BY rowid DESC LIMIT ?", (job_id, ultimas)
+            ).fetchall()
+    return {indice: json.loads(questao) for indice, questao in linhas}
+
+def listar_jobs_usuario(user_id, limite=5):
+    """
+    Lista os jobs mais recentes de um usuário (sem os itens).
+    Args:
+        user_id (str): ID do usuário
+        limite (int, optional): Número máximo de jobs
+    Returns:
+        list: Lista de dicionários com id, status, total, concluidas e criado_em
+    """
+    with _lock:
+        linhas = _conexao.execute(
+            "SELECT id, status, total, concluidas, criado_em FROM jobs WHERE user_id IS ? ORDER BY criado_em DESC LIMIT ?",
+            (user_id, limite)
+        ).fetchall()
+    return [
+        {"id": linha[0], "status": linha[1], "total": linha[2], "concluidas": linha[3], "criado_em": linha[4]}
+        for linha in linhas
+    ]
+
+def contar_questoes_geradas(user_id=None):
+    """
+    Conta as questões geradas pelos jobs de um usuário neste servidor (o banco
+    de jobs é local ao processo). Não conta itens com erro nem questões
+    reaproveitadas do banco.
+    Args:
+        user_id (str, optional): ID do usuário
+    Returns:
+        int: Número de questões geradas com sucesso nos jobs do usuário
+    """
+    with _lock:
+        linha = _conexao.execute(
+            """
+            SELECT COUNT(*) FROM job_questoes q JOIN jobs j ON j.id = q.job_id
+            WHERE j.user_id IS ?
+              AND json_extract(q.questao, '$.erro') IS NULL
+              AND json_extract(q.questao, '$.reaproveitada') IS NULL
+            """,
+            (user_id,)
+        ).fetchone()
+    return linha[0]
+
+def _retomar_jobs():
+    """Recoloca na fila os jobs que estavam pendentes ou em andamento quando o processo parou"""
+    with _lock:
+        linhas = _conexao.execute("SELECT id, parametros FROM jobs WHERE status IN ('pendente', 'em_andamento')").fetchall()
+    for job_id, parametros in linhas:
+        _submeter_job(job_id, json.loads(parametros))
+
+_retomar_jobs()
@@ -0,0 +1,140 @@
+import streamlit as st
+import contextvars
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
+# Métricas das chamadas à API da OpenAI: cada chamada vai para um buffer circular
+# em memória e para um log local só de acréscimo (JSONL), e é agregada por lote
+# de geração (job) para o resumo exibido ao fim de cada geração.
+
+# Lote (job) ao qual as chamadas da thread/contexto atual pertencem
+lote_atual = contextvars.ContextVar("lote_atual", default=None)
+
+_caminho_log = st.secrets.get("METRICAS_ARQUIVO", ".cache/chamadas_openai.jsonl")
+if _caminho_log and os.path.dirname(_caminho_log):
+    os.makedirs(os.path.dirname(_caminho_log), exist_ok=True)
+
+_lock = threading.Lock()
+_recentes = deque(maxlen=int(st.secrets.get("METRICAS_TAMANHO_BUFFER", 2000)))
+_por_lote = OrderedDict()
+_MAX_LOTES = 50
+
+
+def no_contexto_atual(funcao):
+    """
+    Envolve a função para que rode com uma cópia do contexto atual (inclusive o
+    lote), já que threads de um ThreadPoolExecutor não herdam contextvars.
+    Deve ser chamada uma vez por tarefa submetida.
+    """
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(funcao, *args, **kwargs)
+
+
+def registrar_chamada(inicio, duracao, modelo, tentativas, resultado, usage=None, itens=1):
+    """
+    Registra uma chamada à API (incluindo suas novas tentativas).
+    Args:
+        inicio (float): Momento do início (time.time())
+        duracao (float): Tempo total em segundos, incluindo esperas entre tentativas
+        modelo (str): Modelo usado
+        tentativas (int): Número de tentativas feitas
+        resultado (str): "sucesso" ou o nome do erro final
+        usage (CompletionUsage, optional): Uso de tokens informado pela API
+        itens (int, optional): Número de questões pedidas na chamada
+    """
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    registro = {
+        "inicio": inicio,
+        "duracao": round(duracao, 3),
+        "modelo": modelo,
+        "tentativas": tentativas,
+        "resultado": resultado,
+        "tokens_entrada": getattr(usage, "prompt_tokens", None) or 0,
+        "tokens_saida": getattr(usage, "completion_tokens", None) or 0,
+        "tokens_cacheados": getattr(detalhes, "cached_tokens", None) or 0,
+        "itens": itens,
+        "lote": lote_atual.get()
+    }
+    with _lock:
+        _recentes.append(registro)
+        if registro["lote"]:
+            _agregar_lote(registro)
+        if _caminho_log:
+            try:
+                with open(_caminho_log, "a", encoding="utf-8") as arquivo:
+                    arquivo.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Erro ao gravar log de métricas: {str(e)}")
+
+
+def _agregar_lote(registro):
+    """Acumula o registro no agregado do seu lote (deve ser chamado com o lock)"""
+    lote = _por_lote.get(registro["lote"])
+    if lote is None:
+        lote = {"latencias": [], "chamadas": 0, "erros": 0, "tentativas": 0, "questoes": 0,
+                "tokens_entrada": 0, "tokens_saida": 0, "tokens_cacheados": 0,
+                "inicio": registro["inicio"], "fim": registro["inicio"]}
+        _por_lote[registro["lote"]] = lote
+        while len(_por_lote) > _MAX_LOTES:
+            _por_lote.popitem(last=False)
+    lote["chamadas"] += 1
+    lote["tentativas"] += registro["tentativas"]
+    lote["inicio"] = min(lote["inicio"], registro["inicio"])
+    lote["fim"] = max(lote["fim"], registro["inicio"] + registro["duracao"])
+    if registro["resultado"] != "sucesso":
+        lote["erros"] += 1
+        return
+    lote["latencias"].append(registro["duracao"])
+    lote["questoes"] += registro["itens"]
+    lote["tokens_entrada"] += registro["tokens_entrada"]
+    lote["tokens_saida"] += registro["tokens_saida"]
+    lote["tokens_cacheados"] += registro["tokens_cacheados"]
+
+
+def _percentil(valores, p):
+    """Percentil p (0 a 100) de uma lista de valores"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[int(round(p / 100 * (len(ordenados) - 1)))]
+
+
+def resumo_lote(lote):
+    """
+    Resume as chamadas de um lote de geração.
+    Args:
+        lote (str): ID do lote (job)
+    Returns:
+        dict: Latência p50/p95, tokens por questão, questões por minuto, chamadas,
+            erros e tentativas; ou None se o lote não tiver chamadas registradas
+    """
+    with _lock:
+        agregado = _por_lote.get(lote)
+        if agregado is None:
+            return None
+        agregado = dict(agregado, latencias=list(agregado["latencias"]))
+    duracao = agregado["fim"] - agregado["inicio"]
+    questoes = agregado["questoes"]
+    return {
+        "latencia_p50": _percentil(agregado["latencias"], 50),
+        "latencia_p95": _percentil(agregado["latencias"], 95),
+        "tokens_por_questao": (agregado["tokens_entrada"] + agregado["tokens_saida"]) / questoes if questoes else None,
+        "questoes_por_minuto": questoes / (duracao / 60) if duracao > 0 else None,
+        "chamadas": agregado["chamadas"],
+        "erros": agregado["erros"],
+        "tentativas": agregado["tentativas"],
+        "tokens_cacheados": agregado["tokens_cacheados"],
+        "tokens_entrada": agregado["tokens_entrada"]
+    }
+
+
+def chamadas_recentes():
+    """
+    Retorna uma cópia das chamadas mais recentes (buffer circular).
+    Returns:
+        list: Lista de registros, do mais antigo para o mais recente
+    """
+    with _lock:
+        return list(_recentes)
@@ -1,16 +1,185 @@
 import streamlit as st
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+from services.rate_limiter import LimitadorTaxa, estimar_tokens
+from services.retry import HistoricoLatencia, erro_recuperavel, tempo_espera
+from services.metricas import no_contexto_atual, registrar_chamada
+from services.cache_questoes import CacheQuestoes, chave_questao
 import json
+import threading
+import time
 
 openai_api_key = st.secrets["OPENAI_API_KEY"]
-client = OpenAI(api_key=openai_api_key)
+# As novas tentativas são feitas por _chamar_api (max_retries=0 evita repeti-las em dobro no SDK)
+client = OpenAI(
+    api_key=openai_api_key,
+    timeout=float(st.secrets.get("OPENAI_TIMEOUT", 120)),
+    max_retries=0
+)
 
-def gerar_questao(item_json, dificuldade):
+# Modelo usado na geração das questões
+MODELO = st.secrets.get("OPENAI_MODELO", "gpt-4o-mini")
+# Versão do template do prompt; altere ao mudar o prompt para invalidar o cache
+VERSAO_PROMPT = "2"
+
+# Número máximo de chamadas simultâneas à API durante a geração em lote
+MAX_CONCORRENCIA = int(st.secrets.get("OPENAI_MAX_CONCORRENCIA", 8))
+# Intervalo (em segundos) entre consultas ao status de um lote da Batch API
+INTERVALO_CONSULTA_LOTE = int(st.secrets.get("OPENAI_BATCH_INTERVALO", 30))
+# Número máximo de requisições por arquivo enviado à Batch API
+TAMANHO_MAXIMO_LOTE = 50000
+# Tentativas extras para erros transitórios (429, 5xx, timeout, conexão)
+MAX_TENTATIVAS = int(st.secrets.get("OPENAI_MAX_TENTATIVAS", 4))
+# Se True, duplica chamadas que passarem da latência p95 e usa a primeira resposta
+HEDGE_ATIVO = bool(st.secrets.get("OPENAI_HEDGE", False))
+
+# Limitador compartilhado por todas as sessões do processo, ajustado pelos cabeçalhos da API
+limitador = LimitadorTaxa(
+    requisicoes_por_minuto=st.secrets.get("OPENAI_RPM", 500),
+    tokens_por_minuto=st.secrets.get("OPENAI_TPM", 200000),
+    concorrencia_maxima=MAX_CONCORRENCIA
+)
+
+# Cache em disco das questões geradas (desativado se CACHE_QUESTOES_ARQUIVO for vazio)
+_caminho_cache = st.secrets.get("CACHE_QUESTOES_ARQUIVO", ".cache/questoes.sqlite3")
+cache = CacheQuestoes(
+    _caminho_cache,
+    ttl_segundos=int(st.secrets.get("CACHE_QUESTOES_TTL_DIAS", 30)) * 24 * 3600,
+    max_entradas=int(st.secrets.get("CACHE_QUESTOES_MAX_ENTRADAS", 50000))
+) if _caminho_cache else None
+
+# Latências recentes por número de questões pedidas na chamada (para o hedge: uma
+# chamada agrupada é naturalmente mais lenta e não pode usar o p95 das individuais)
+# e threads usadas pelas chamadas duplicadas
+latencias = {}
+_lock_latencias = threading.Lock()
+_executor_hedge = ThreadPoolExecutor(max_workers=MAX_CONCORRENCIA * 2, thread_name_prefix="hedge")
+
+# Uso do cache de prefixo do prompt (usage.prompt_tokens_details.cached_tokens)
+_uso_cache_prompt = {"chamadas": 0, "tokens_entrada": 0, "tokens_cacheados": 0}
+_lock_uso_cache_prompt = threading.Lock()
+
+def _registrar_uso_cache_prompt(usage):
+    """Acumula os tokens de entrada e os tokens servidos pelo cache de prefixo da OpenAI"""
+    if usage is None:
+        return
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    cacheados = getattr(detalhes, "cached_tokens", None) or 0
+    with _lock_uso_cache_prompt:
+        _uso_cache_prompt["chamadas"] += 1
+        _uso_cache_prompt["tokens_entrada"] += usage.prompt_tokens or 0
+        _uso_cache_prompt["tokens_cacheados"] += cacheados
+
+def uso_cache_prompt():
+    """
+    Retorna o uso acumulado do cache de prefixo do prompt neste processo.
+    Returns:
+        dict: Chamadas, tokens de entrada, tokens cacheados e taxa de acerto (0 a 1)
+    """
+    with _lock_uso_cache_prompt:
+        uso = dict(_uso_cache_prompt)
+    uso["taxa_acerto"] = uso["tokens_cacheados"] / uso["tokens_entrada"] if uso["tokens_entrada"] else 0.0
+    return uso
+
+def _chamar_api(mensagens, tokens_resposta=1000, itens=1):
+    """
+    Faz a chamada de chat à API da OpenAI respeitando o limitador de taxa.
+    Erros transitórios (429, 5xx, timeout, conexão) são repetidos com backoff
+    exponencial e jitter; os demais são propagados na hora. Com HEDGE_ATIVO,
+    chamadas mais lentas que a latência p95 são duplicadas. Tempo, tokens,
+    tentativas e resultado de cada chamada são registrados em services.metricas.
+    Args:
+        mensagens (list): Lista de mensagens no formato da API de chat
+        tokens_resposta (int, optional): Estimativa de tokens da resposta, usada pelo limitador
+        itens (int, optional): Número de questões pedidas na chamada (para as métricas)
+    Returns:
+        ChatCompletion: Resposta da API
+    """
+    tokens_estimados = estimar_tokens(mensagens, tokens_resposta)
+    inicio = time.time()
+    relogio = time.monotonic()
+    for tentativa in range(MAX_TENTATIVAS + 1):
+        try:
+            if HEDGE_ATIVO:
+                response = _chamar_com_hedge(mensagens, tokens_estimados, itens)
+            else:
+                response = _chamar_api_uma_vez(mensagens, tokens_estimados, itens)
+            registrar_chamada(inicio, time.monotonic() - relogio, MODELO, tentativa + 1, "sucesso", response.usage, itens)
+            return response
+        except Exception as e:
+            if tentativa == MAX_TENTATIVAS or not erro_recuperavel(e):
+                registrar_chamada(inicio, time.monotonic() - relogio, MODELO, tentativa + 1, type(e).__name__, itens=itens)
+                raise
+            espera = tempo_espera(tentativa)
+            print(f"Erro transitório na API da OpenAI ({type(e).__name__}), nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+def _historico_latencia(itens):
+    """Retorna o histórico de latências das chamadas com o número de itens informado"""
+    with _lock_latencias:
+        if itens not in latencias:
+            latencias[itens] = HistoricoLatencia()
+        return latencias[itens]
+
+def _chamar_api_uma_vez(mensagens, tokens_estimados, itens=1):
+    """Faz uma única chamada à API, passando pelo limitador de taxa"""
+    limitador.adquirir(tokens_estimados)
+    inicio = time.monotonic()
+    try:
+        resposta_bruta = client.chat.completions.with_raw_response.create(
+            model=MODELO,
+            messages=mensagens,
+            response_format={"type": "json_object"}  # Garante que a resposta seja em formato JSON
+        )
+    except RateLimitError as e:
+        limitador.registrar_limite_excedido(e.response.headers)
+        raise
+    except Exception:
+        limitador.registrar_falha()
+        raise
+    # A vaga no limitador é devolvida mesmo que o processamento da resposta falhe
+    tokens_usados = None
+    try:
+        _historico_latencia(itens).registrar(time.monotonic() - inicio)
+        response = resposta_bruta.parse()
+        tokens_usados = response.usage.total_tokens if response.usage else None
+        _registrar_uso_cache_prompt(response.usage)
+    finally:
+        limitador.liberar(tokens_estimados, tokens_usados, resposta_bruta.headers)
+    return response
+
+def _chamar_com_hedge(mensagens, tokens_estimados, itens=1):
+    """
+    Faz a chamada e, se ela passar da latência p95 das chamadas com o mesmo
+    número de itens, dispara uma cópia, retornando a primeira resposta bem-sucedida.
+    """
+    limite = _historico_latencia(itens).percentil(95)
+    principal = _executor_hedge.submit(no_contexto_atual(_chamar_api_uma_vez), mensagens, tokens_estimados, itens)
+    if limite is None:
+        return principal.result()
+    try:
+        return principal.result(timeout=limite)
+    except FuturesTimeoutError:
+        pass
+    reserva = _executor_hedge.submit(no_contexto_atual(_chamar_api_uma_vez), mensagens, tokens_estimados, itens)
+    pendentes = {principal, reserva}
+    erro = None
+    while pendentes:
+        prontos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+        for futuro in prontos:
+            if futuro.exception() is None:
+                return futuro.result()
+            erro = futuro.exception()
+    raise erro
+
+def gerar_questao(item_json, dificuldade, forcar_nova=False, ocorrencia=0):
     """
     Gera questões de múltipla escolha baseadas nos dados fornecidos.  
     Args:
         item_json (dict): Um dicionário contendo 'codigo', 'materia', 'tema', 'subtema' e 'assunto'
         dificuldade (str): Nível de dificuldade da questão ('fácil', 'médio' ou 'difícil')
+        forcar_nova (bool, optional): Se True, ignora o cache e gera uma questão nova
+        ocorrencia (int, optional): Ocorrência do item na planilha (ver numerar_ocorrencias)
     Returns:
         dict: Questão gerada em formato JSON
     """
@@ -21,67 +190,16 @@ def gerar_questao(item_json, dificuldade):
         tema = item_json.get('tema', '')
         subtema = item_json.get('subtema', '')
         assunto = item_json.get('assunto', '')     
-        # Cria o prompt para a API
-        prompt = f"""
-        1. Objetivos
-        Você é um gerador de questões para que alunos que estão em fase pré-vestibular possam usar essa questão para ajudá-los a estudar. 
-        Vou apresentar a você: matéria, tema, subtema e assunto. 
-        Com isso você deverá elaborar uma questão (enunciado) de múltipla escolha, com 5 alternativas possíveis. 
-        Também deverá apresentar a alternativa correta (gabarito) e uma descrição da resolução da questão.
-        A questão poderá ter 3 níveis de dificuldade: fácil, médio e difícil. Abaixo vou apresentar qual o nível de dificuldade da questão.
-
-        Matéria: {materia}
-        Tema: {tema}
-        Subtema: {subtema}
-        Assunto: {assunto}
-
-        Nível de dificuldade: {dificuldade}
-
-        2. Como deve ser a resposta
-        A resposta deverá ser no seguinte formato JSON:
-        {{
-            "enunciado":"[enunciado]" 
-            "alternativa1":"[alternativa 1]"
-            "alternativa2":"[alternativa 2]"
-            "alternativa3":"[alternativa 3]"
-            "alternativa4":"[alternativa 4]"
-            "alternativa5":"[alternativa 5]"
-            "gabarito":"[gabarito]"
-            "resolucao":"[resolucao]"
-        }} 
-        
-        3. Alertas e avisos
-        Certifique-se de que a resposta apontada da questão esteja correta. Se necessário faça várias checagens para que a resposta apontada seja a correta, isso é MUITO IMPORTANTE.
-        O formato da exibição da alternativa deverá ser no seguinte formato: A) Descrição da alternativa 1
-        O gabarito deverá ser apresentado na alternativa na forma literal, ou seja, repetindo a descrição da alternativa correta.
-        Um exemplo do formato do gabarito: Descrição da alternativa 4
-        A resolução deverá ser elaborada de maneira clara e interessante, de maneira que o aluno possa entender e aprender o conteúdo da questão.
-        Quando houver fórmulas matemáticas, utilize o formato LaTeX para apresentá-las, ou seja, use sempre o símbolo $ para delimitar o início e o fim da fórmula matemática.
-        Não utilize os simbolos \( ou \) ou \[ ou \] para delimitar o início e o fim da fórmula matemática, pois isso pode dar erro na apresentação da fórmula matemática, use o símbolo $ no início e no fim da fórmula.
-        É muito importante que todas as fórmulas estejam no formato LaTeX, se preciso faça várias checagens para se certificar disso.
-        Exemplo de como apresentar o teorema de pitágoras no formato LaTeX: $a^2 + b^2 = c^2$.
-        
-        4. Contexto
-        Elabore a questão e suas alternativas cuidadosamente, de maneira original e interessante para despertar a curiosidade e engajar o aluno a pensar para responder.       
-        """     
-        # Faz a chamada para a API da OpenAI
-        # O modelo gpt-4o é o mais recente da OpenAI (lançado após seu conhecimento de corte)
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}  # Garante que a resposta seja em formato JSON
-        )
-        # Extrai e retorna o JSON da resposta
-        resultado = json.loads(response.choices[0].message.content)
+        # Consultar o cache antes de pagar por uma nova geração
+        chave = _chave_item(item_json, dificuldade, ocorrencia)
+        resultado = cache.obter(chave) if cache and not forcar_nova else None
+        if resultado is None:
+            resultado = _gerar_conteudo_questao(materia, tema, subtema, assunto, dificuldade)
+            # Não guardar uma resposta incompleta: ela seria servida até expirar
+            if cache and _questao_valida(resultado):
+                cache.salvar(chave, resultado)
         # Adiciona metadados do conteúdo original
-        resultado["metadados"] = {
-            "codigo": codigo,
-            "materia": materia,
-            "tema": tema,
-            "subtema": subtema,
-            "assunto": assunto,
-            "dificuldade": dificuldade    
-        }  
+        resultado["metadados"] = _montar_metadados(item_json, dificuldade)
         return resultado
     except Exception as e:
         print(f"Erro ao gerar questão: {str(e)}")
@@ -102,16 +220,429 @@ def gerar_questao(item_json, dificuldade):
             }
         }
 
-def gerar_lista_questoes(lista_json, dificuldade):
+def _chave_item(item_json, dificuldade, ocorrencia=0):
+    """Calcula a chave do cache de questões para um item"""
+    return chave_questao(
+        item_json.get('materia', ''), item_json.get('tema', ''), item_json.get('subtema', ''),
+        item_json.get('assunto', ''), dificuldade, MODELO, VERSAO_PROMPT, ocorrencia
+    )
+
+def numerar_ocorrencias(lista_json):
+    """
+    Numera as repetições de cada item na lista: a primeira vez que uma combinação
+    de matéria, tema, subtema e assunto aparece recebe 0, a segunda 1, e assim por
+    diante. Usado na chave do cache para que linhas repetidas não recebam a mesma questão.
+    Args:
+        lista_json (list): Lista de itens
+    Returns:
+        list: Número da ocorrência de cada item, na ordem da lista
+    """
+    vistos = {}
+    ocorrencias = []
+    for item in lista_json:
+        tupla = tuple(str(item.get(campo, '')).strip() for campo in ('materia', 'tema', 'subtema', 'assunto'))
+        ocorrencias.append(vistos.get(tupla, 0))
+        vistos[tupla] = ocorrencias[-1] + 1
+    return ocorrencias
+
+def _montar_metadados(item_json, dificuldade):
+    """Monta o dicionário de metadados anexado a cada questão gerada"""
+    return {
+        "codigo": item_json.get('codigo', ''),
+        "materia": item_json.get('materia', ''),
+        "tema": item_json.get('tema', ''),
+        "subtema": item_json.get('subtema', ''),
+        "assunto": item_json.get('assunto', ''),
+        "dificuldade": dificuldade
+    }
+
+def _gerar_conteudo_questao(materia, tema, subtema, assunto, dificuldade):
+    """
+    Chama a API para gerar o conteúdo de uma questão (sem metadados).
+    Returns:
+        dict: Enunciado, alternativas, gabarito e resolução
+    """
+    # Faz a chamada para a API da OpenAI, respeitando os limites de taxa
+    response = _chamar_api(_montar_mensagens(materia, tema, subtema, assunto, dificuldade))
+    # Extrai e retorna o JSON da resposta
+    return json.loads(response.choices[0].message.content)
+
+# Orientações comuns a todos os prompts de geração
+_ALERTAS_E_CONTEXTO = """
+3. Alertas e avisos
+Certifique-se de que a resposta apontada da questão esteja correta. Se necessário faça várias checagens para que a resposta apontada seja a correta, isso é MUITO IMPORTANTE.
+O formato da exibição da alternativa deverá ser no seguinte formato: A) Descrição da alternativa 1
+O gabarito deverá ser apresentado na alternativa na forma literal, ou seja, repetindo a descrição da alternativa correta.
+Um exemplo do formato do gabarito: Descrição da alternativa 4
+A resolução deverá ser elaborada de maneira clara e interessante, de maneira que o aluno possa entender e aprender o conteúdo da questão.
+Quando houver fórmulas matemáticas, utilize o formato LaTeX para apresentá-las, ou seja, use sempre o símbolo $ para delimitar o início e o fim da fórmula matemática.
+Não utilize os simbolos \\( ou \\) ou \\[ ou \\] para delimitar o início e o fim da fórmula matemática, pois isso pode dar erro na apresentação da fórmula matemática, use o símbolo $ no início e no fim da fórmula.
+É muito importante que todas as fórmulas estejam no formato LaTeX, se preciso faça várias checagens para se certificar disso.
+Exemplo de como apresentar o teorema de pitágoras no formato LaTeX: $a^2 + b^2 = c^2$.
+
+4. Contexto
+Elabore a questão e suas alternativas cuidadosamente, de maneira original e interessante para despertar a curiosidade e engajar o aluno a pensar para responder.
+"""
+
+# Instruções fixas (mensagem de sistema) para gerar uma questão. Ficam no início
+# da requisição, idênticas em todas as chamadas, para aproveitar o cache de prefixo
+# da OpenAI; os dados do item vão por último, na mensagem do usuário.
+_INSTRUCOES_QUESTAO = """
+1. Objetivos
+Você é um gerador de questões para que alunos que estão em fase pré-vestibular possam usar essa questão para ajudá-los a estudar. 
+Na mensagem do usuário vou apresentar a você: matéria, tema, subtema e assunto. 
+Com isso você deverá elaborar uma questão (enunciado) de múltipla escolha, com 5 alternativas possíveis. 
+Também deverá apresentar a alternativa correta (gabarito) e uma descrição da resolução da questão.
+A questão poderá ter 3 níveis de dificuldade: fácil, médio e difícil. Na mensagem do usuário também vou apresentar qual o nível de dificuldade da questão.
+
+2. Como deve ser a resposta
+A resposta deverá ser no seguinte formato JSON:
+{
+    "enunciado":"[enunciado]" 
+    "alternativa1":"[alternativa 1]"
+    "alternativa2":"[alternativa 2]"
+    "alternativa3":"[alternativa 3]"
+    "alternativa4":"[alternativa 4]"
+    "alternativa5":"[alternativa 5]"
+    "gabarito":"[gabarito]"
+    "resolucao":"[resolucao]"
+} 
+""" + _ALERTAS_E_CONTEXTO
+
+# Instruções fixas (mensagem de sistema) para gerar várias questões em uma chamada
+_INSTRUCOES_QUESTOES_AGRUPADAS = """
+1. Objetivos
+Você é um gerador de questões para que alunos que estão em fase pré-vestibular possam usar essas questões para ajudá-los a estudar. 
+Na mensagem do usuário vou apresentar a você uma lista numerada de itens, cada um com matéria, tema, subtema e assunto. 
+Para CADA item você deverá elaborar uma questão (enunciado) de múltipla escolha, com 5 alternativas possíveis. 
+Também deverá apresentar a alternativa correta (gabarito) e uma descrição da resolução de cada questão.
+Se o mesmo assunto aparecer em mais de um item, elabore questões diferentes para cada ocorrência.
+As questões poderão ter 3 níveis de dificuldade: fácil, médio e difícil. Todas as questões da lista devem ter o nível informado na mensagem do usuário.
+
+2. Como deve ser a resposta
+A resposta deverá ser no seguinte formato JSON, com exatamente um elemento em "questoes" para cada item, na mesma ordem:
+{
+    "questoes": [
+        {
+            "item": [número do item]
+            "enunciado":"[enunciado]" 
+            "alternativa1":"[alternativa 1]"
+            "alternativa2":"[alternativa 2]"
+            "alternativa3":"[alternativa 3]"
+            "alternativa4":"[alternativa 4]"
+            "alternativa5":"[alternativa 5]"
+            "gabarito":"[gabarito]"
+            "resolucao":"[resolucao]"
+        }
+    ]
+} 
+""" + _ALERTAS_E_CONTEXTO
+
+def _montar_mensagens(materia, tema, subtema, assunto, dificuldade):
     """
-    Gera questões de múltipla escolha para uma lista de itens JSON.  
+    Monta as mensagens enviadas à API para gerar uma questão.
+    Returns:
+        list: Lista de mensagens no formato da API de chat
+    """
+    dados = (
+        f"Matéria: {materia}\n"
+        f"Tema: {tema}\n"
+        f"Subtema: {subtema}\n"
+        f"Assunto: {assunto}\n\n"
+        f"Nível de dificuldade: {dificuldade}"
+    )
+    return [
+        {"role": "system", "content": _INSTRUCOES_QUESTAO},
+        {"role": "user", "content": dados}
+    ]
+
+def _montar_mensagens_agrupadas(itens, dificuldade):
+    """
+    Monta as mensagens para gerar várias questões (uma por item) em uma única chamada.
+    Args:
+        itens (list): Lista de dicionários com 'materia', 'tema', 'subtema' e 'assunto'
+        dificuldade (str): Nível de dificuldade das questões
+    Returns:
+        list: Lista de mensagens no formato da API de chat
+    """
+    lista_itens = "\n".join(
+        f"Item {numero}: Matéria: {item.get('materia', '')} | Tema: {item.get('tema', '')} | "
+        f"Subtema: {item.get('subtema', '')} | Assunto: {item.get('assunto', '')}"
+        for numero, item in enumerate(itens, start=1)
+    )
+    return [
+        {"role": "system", "content": _INSTRUCOES_QUESTOES_AGRUPADAS},
+        {"role": "user", "content": f"{lista_itens}\n\nNível de dificuldade: {dificuldade}"}
+    ]
+
+def gerar_lista_questoes(lista_json, dificuldade, max_concorrencia=None, ao_concluir=None, forcar_nova=False, ocorrencias=None):
+    """
+    Gera questões de múltipla escolha para uma lista de itens JSON.
+    As chamadas à API são feitas em paralelo, limitadas a max_concorrencia
+    requisições simultâneas, e o resultado mantém a ordem da lista de entrada.
     Args:
         lista_json (list): Lista de dicionários com os dados para geração de questões
+        dificuldade (str): Nível de dificuldade das questões
+        max_concorrencia (int, optional): Número máximo de chamadas simultâneas (padrão: MAX_CONCORRENCIA)
+        ao_concluir (callable, optional): Função chamada como ao_concluir(indice, questao)
+            a cada questão concluída, na thread de quem chamou (útil para atualizar a interface)
+        forcar_nova (bool, optional): Se True, ignora o cache e gera questões novas
+        ocorrencias (list, optional): Ocorrência de cada item na planilha original (ver
+            numerar_ocorrencias); necessária quando lista_json é só uma parte da planilha
     Returns:
         list: Lista de questões geradas em formato JSON
     """
-    resultados = []
-    for item in lista_json:
-        questao = gerar_questao(item, dificuldade)
-        resultados.append(questao)      
-    return resultados
\ No newline at end of file
+    if not lista_json:
+        return []
+    if max_concorrencia is None:
+        max_concorrencia = MAX_CONCORRENCIA
+    max_concorrencia = max(1, min(max_concorrencia, len(lista_json)))
+    resultados = [None] * len(lista_json)
+    if ocorrencias is None:
+        ocorrencias = numerar_ocorrencias(lista_json)
+    with ThreadPoolExecutor(max_workers=max_concorrencia) as executor:
+        futuros = {
+            executor.submit(no_contexto_atual(gerar_questao), item, dificuldade, forcar_nova, ocorrencias[indice]): indice
+            for indice, item in enumerate(lista_json)
+        }
+        # Recolher as questões à medida que ficam prontas, guardando-as na posição original
+        for futuro in as_completed(futuros):
+            indice = futuros[futuro]
+            questao = futuro.result()
+            resultados[indice] = questao
+            if ao_concluir:
+                ao_concluir(indice, questao)
+    return resultados
+
+
+def _questao_valida(questao):
+    """Verifica se uma questão retornada pela API tem todos os campos esperados"""
+    campos = ["enunciado", "alternativa1", "alternativa2", "alternativa3",
+              "alternativa4", "alternativa5", "gabarito", "resolucao"]
+    return isinstance(questao, dict) and all(questao.get(campo) for campo in campos)
+
+def _gerar_grupo(itens, dificuldade):
+    """
+    Gera as questões de um grupo de itens em uma única chamada à API.
+    Args:
+        itens (list): Itens do grupo
+        dificuldade (str): Nível de dificuldade das questões
+    Returns:
+        list: Questões na ordem dos itens (None nas posições que não puderam ser interpretadas)
+    """
+    questoes = [None] * len(itens)
+    try:
+        response = _chamar_api(
+            _montar_mensagens_agrupadas(itens, dificuldade),
+            tokens_resposta=1000 * len(itens),
+            itens=len(itens)
+        )
+        lista = json.loads(response.choices[0].message.content).get("questoes", [])
+    except Exception as e:
+        print(f"Erro ao gerar grupo de questões: {str(e)}")
+        return questoes
+    for posicao, questao in enumerate(lista):
+        if not isinstance(questao, dict):
+            continue
+        # Usar o número do item informado pelo modelo; se ausente, a posição na lista
+        numero = questao.pop("item", posicao + 1)
+        try:
+            indice = int(numero) - 1
+        except (TypeError, ValueError):
+            indice = posicao
+        if 0 <= indice < len(itens) and questoes[indice] is None and _questao_valida(questao):
+            questoes[indice] = questao
+    return questoes
+
+def gerar_lista_questoes_agrupadas(lista_json, dificuldade, itens_por_chamada=5, max_concorrencia=None, ao_concluir=None, ocorrencias=None):
+    """
+    Gera questões agrupando vários itens em cada chamada à API, o que reduz o
+    número de requisições e os tokens de instruções repetidas. Itens que não
+    vierem na resposta ou vierem incompletos são gerados individualmente.
+    Args:
+        lista_json (list): Lista de dicionários com os dados para geração de questões
+        dificuldade (str): Nível de dificuldade das questões
+        itens_por_chamada (int, optional): Número de itens (K) enviados em cada chamada
+        max_concorrencia (int, optional): Número máximo de chamadas simultâneas (padrão: MAX_CONCORRENCIA)
+        ao_concluir (callable, optional): Função chamada como ao_concluir(indice, questao)
+            a cada questão concluída, na thread de quem chamou
+        ocorrencias (list, optional): Ocorrência de cada item na planilha original (ver
+            numerar_ocorrencias); necessária quando lista_json é só uma parte da planilha
+    Returns:
+        list: Lista de questões geradas em formato JSON, na ordem da lista de entrada
+    """
+    if not lista_json:
+        return []
+    if max_concorrencia is None:
+        max_concorrencia = MAX_CONCORRENCIA
+    itens_por_chamada = max(1, itens_por_chamada)
+    resultados = [None] * len(lista_json)
+    if ocorrencias is None:
+        ocorrencias = numerar_ocorrencias(lista_json)
+    # Servir do cache o que já foi gerado e agrupar apenas os itens restantes
+    pendentes = []
+    for indice, item in enumerate(lista_json):
+        questao = cache.obter(_chave_item(item, dificuldade, ocorrencias[indice])) if cache else None
+        if questao is not None:
+            questao["metadados"] = _montar_metadados(item, dificuldade)
+            resultados[indice] = questao
+            if ao_concluir:
+                ao_concluir(indice, questao)
+        else:
+            pendentes.append(indice)
+    grupos = [pendentes[i:i + itens_por_chamada] for i in range(0, len(pendentes), itens_por_chamada)]
+    if not grupos:
+        return resultados
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concorrencia, len(grupos)))) as executor:
+        futuros = {
+            executor.submit(no_contexto_atual(_gerar_grupo), [lista_json[i] for i in grupo], dificuldade): grupo
+            for grupo in grupos
+        }
+        falhas = []
+        for futuro in as_completed(futuros):
+            grupo = futuros[futuro]
+            for indice, questao in zip(grupo, futuro.result()):
+                if questao is None:
+                    falhas.append(indice)
+                    continue
+                item = lista_json[indice]
+                if cache:
+                    cache.salvar(_chave_item(item, dificuldade, ocorrencias[indice]), questao)
+                questao["metadados"] = _montar_metadados(item, dificuldade)
+                resultados[indice] = questao
+                if ao_concluir:
+                    ao_concluir(indice, questao)
+        # Gerar individualmente os itens que falharam no grupo
+        futuros = {
+            executor.submit(no_contexto_atual(gerar_questao), lista_json[indice], dificuldade, True, ocorrencias[indice]): indice
+            for indice in falhas
+        }
+        for futuro in as_completed(futuros):
+            indice = futuros[futuro]
+            resultados[indice] = futuro.result()
+            if ao_concluir:
+                ao_concluir(indice, resultados[indice])
+    return resultados
+
+def gerar_lista_questoes_lote(lista_json, dificuldade, intervalo_consulta=None, ao_atualizar=None, cliente=None, ocorrencias=None,
+                              ids_lotes=None, ao_criar_lotes=None):
+    """
+    Gera questões usando a Batch API da OpenAI, indicada para planilhas muito
+    grandes: o custo por questão é menor, mas o resultado pode levar horas.
+    Os prompts são gravados em um arquivo JSONL, o lote é enviado e consultado
+    periodicamente até terminar, e as respostas voltam no mesmo formato de
+    gerar_lista_questoes, incluindo os metadados. Itens já presentes no cache
+    não são enviados.
+    Args:
+        lista_json (list): Lista de dicionários com os dados para geração de questões
+        dificuldade (str): Nível de dificuldade das questões
+        intervalo_consulta (float, optional): Segundos entre consultas ao status do lote
+        ao_atualizar (callable, optional): Função chamada como ao_atualizar(lote) a cada consulta
+        cliente (OpenAI, optional): Cliente a usar (permite apontar para um servidor local de testes)
+        ocorrencias (list, optional): Ocorrência de cada item na planilha original (ver
+            numerar_ocorrencias); necessária quando lista_json é só uma parte da planilha
+        ids_lotes (list, optional): IDs de lotes já enviados para esta mesma lista; se
+            informado, nenhum lote novo é criado e apenas esses são acompanhados
+            (permite retomar a consulta após reiniciar o processo)
+        ao_criar_lotes (callable, optional): Função chamada como ao_criar_lotes(ids_lotes)
+            logo após o envio dos lotes, para que os IDs possam ser guardados
+    Returns:
+        list: Lista de questões geradas em formato JSON, na ordem da lista de entrada
+    """
+    # O SDK repete as chamadas de arquivos e consultas de status que falharem
+    cliente = cliente or client.with_options(max_retries=3)
+    if intervalo_consulta is None:
+        intervalo_consulta = INTERVALO_CONSULTA_LOTE
+    resultados = [None] * len(lista_json)
+    chaves = {}
+    linhas = []
+    if ocorrencias is None:
+        ocorrencias = numerar_ocorrencias(lista_json)
+    for indice, item in enumerate(lista_json):
+        chaves[indice] = _chave_item(item, dificuldade, ocorrencias[indice])
+        questao = cache.obter(chaves[indice]) if cache else None
+        if questao is not None:
+            questao["metadados"] = _montar_metadados(item, dificuldade)
+            resultados[indice] = questao
+            continue
+        # Ao retomar lotes já enviados, as requisições não precisam ser montadas
+        if ids_lotes is not None:
+            continue
+        linhas.append(json.dumps({
+            "custom_id": str(indice),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODELO,
+                "messages": _montar_mensagens(
+                    item.get('materia', ''), item.get('tema', ''), item.get('subtema', ''),
+                    item.get('assunto', ''), dificuldade
+                ),
+                "response_format": {"type": "json_object"}
+            }
+        }, ensure_ascii=False))
+    # Enviar os lotes (respeitando o limite de requisições por arquivo), a menos que já tenham sido enviados
+    if ids_lotes is None:
+        ids_lotes = []
+        for inicio in range(0, len(linhas), TAMANHO_MAXIMO_LOTE):
+            conteudo = "\n".join(linhas[inicio:inicio + TAMANHO_MAXIMO_LOTE]).encode('utf-8')
+            arquivo = cliente.files.create(file=("questoes.jsonl", conteudo), purpose="batch")
+            ids_lotes.append(cliente.batches.create(
+                input_file_id=arquivo.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            ).id)
+        if ao_criar_lotes:
+            ao_criar_lotes(ids_lotes)
+    # Consultar o status até todos os lotes terminarem
+    pendentes = list(ids_lotes)
+    finalizados = []
+    while pendentes:
+        ainda_pendentes = []
+        for id_lote in pendentes:
+            lote = cliente.batches.retrieve(id_lote)
+            if ao_atualizar:
+                ao_atualizar(lote)
+            if lote.status in ("completed", "failed", "expired", "cancelled"):
+                finalizados.append(lote)
+            else:
+                ainda_pendentes.append(id_lote)
+        pendentes = ainda_pendentes
+        if pendentes:
+            time.sleep(intervalo_consulta)
+    # Ler as respostas e os erros de cada lote
+    erros = {}
+    for lote in finalizados:
+        if getattr(lote, "output_file_id", None):
+            for linha in cliente.files.content(lote.output_file_id).text.splitlines():
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                indice = int(registro["custom_id"])
+                resposta = registro.get("response") or {}
+                try:
+                    if resposta.get("status_code") != 200:
+                        raise Exception(registro.get("error") or f"status HTTP {resposta.get('status_code')}: {resposta.get('body')}")
+                    questao = json.loads(resposta["body"]["choices"][0]["message"]["content"])
+                except Exception as e:
+                    erros[indice] = str(e)
+                    continue
+                if cache and _questao_valida(questao):
+                    cache.salvar(chaves[indice], questao)
+                questao["metadados"] = _montar_metadados(lista_json[indice], dificuldade)
+                resultados[indice] = questao
+        if getattr(lote, "error_file_id", None):
+            for linha in cliente.files.content(lote.error_file_id).text.splitlines():
+                if linha.strip():
+                    registro = json.loads(linha)
+                    erros[int(registro["custom_id"])] = str(registro.get("error") or registro.get("response"))
+    # Itens sem resposta (lote com falha, expirado ou erro na requisição)
+    for indice, questao in enumerate(resultados):
+        if questao is None:
+            motivo = erros.get(indice, "lote não concluído")
+            print(f"Erro ao gerar questão em lote: {motivo}")
+            resultados[indice] = {
+                "erro": f"Não foi possível gerar uma questão: {motivo}",
+                "metadados": _montar_metadados(lista_json[indice], dificuldade)
+            }
+    return resultados
@@ -0,0 +1,163 @@
+import threading
+import time
+
+
+def estimar_tokens(mensagens, tokens_resposta=1000):
+    """
+    Estima o número de tokens que uma chamada vai consumir (entrada + resposta).
+    Usa a aproximação de ~4 caracteres por token, suficiente para o controle de taxa.
+    Args:
+        mensagens (list): Lista de mensagens no formato da API de chat
+        tokens_resposta (int): Estimativa de tokens da resposta
+    Returns:
+        int: Número estimado de tokens
+    """
+    caracteres = sum(len(m.get('content') or '') for m in mensagens)
+    return caracteres // 4 + tokens_resposta
+
+
+def _ler_numero(cabecalhos, nome):
+    """Lê um cabeçalho numérico, retornando None se ausente ou inválido"""
+    try:
+        valor = cabecalhos.get(nome)
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LimitadorTaxa:
+    """
+    Limitador do tipo token bucket para a API da OpenAI, que controla ao mesmo
+    tempo requisições por minuto, tokens por minuto e o número de chamadas
+    simultâneas. Os limites são ajustados com base nos cabeçalhos
+    x-ratelimit-* e retry-after devolvidos pela API.
+    """
+
+    def __init__(self, requisicoes_por_minuto, tokens_por_minuto, concorrencia_maxima):
+        self._condicao = threading.Condition()
+        self.requisicoes_por_minuto = float(requisicoes_por_minuto)
+        self.tokens_por_minuto = float(tokens_por_minuto)
+        self.concorrencia_maxima = max(1, int(concorrencia_maxima))
+        self.concorrencia = self.concorrencia_maxima
+        self._requisicoes_disponiveis = self.requisicoes_por_minuto
+        self._tokens_disponiveis = self.tokens_por_minuto
+        self._em_andamento = 0
+        self._pausa_ate = 0.0
+        self._ultima_reposicao = time.monotonic()
+
+    def _repor(self):
+        """Repõe os baldes proporcionalmente ao tempo decorrido (deve ser chamado com o lock)"""
+        agora = time.monotonic()
+        decorrido = agora - self._ultima_reposicao
+        self._ultima_reposicao = agora
+        self._requisicoes_disponiveis = min(
+            self.requisicoes_por_minuto,
+            self._requisicoes_disponiveis + decorrido * self.requisicoes_por_minuto / 60
+        )
+        self._tokens_disponiveis = min(
+            self.tokens_por_minuto,
+            self._tokens_disponiveis + decorrido * self.tokens_por_minuto / 60
+        )
+
+    def _espera_necessaria(self, tokens):
+        """Retorna quantos segundos faltam para a chamada poder ser feita (0 se já puder)"""
+        agora = time.monotonic()
+        if self._pausa_ate > agora:
+            return self._pausa_ate - agora
+        if self._em_andamento >= self.concorrencia:
+            # Será acordado quando alguma chamada terminar
+            return 1.0
+        # Uma chamada maior que o balde inteiro só precisa esperar o balde encher
+        tokens = min(tokens, self.tokens_por_minuto)
+        falta_requisicoes = max(0.0, 1 - self._requisicoes_disponiveis)
+        falta_tokens = max(0.0, tokens - self._tokens_disponiveis)
+        return max(
+            falta_requisicoes * 60 / self.requisicoes_por_minuto,
+            falta_tokens * 60 / self.tokens_por_minuto
+        )
+
+    def adquirir(self, tokens_estimados):
+        """
+        Bloqueia até que a chamada possa ser feita sem exceder os limites.
+        Args:
+            tokens_estimados (int): Tokens que a chamada deve consumir
+        """
+        with self._condicao:
+            while True:
+                self._repor()
+                espera = self._espera_necessaria(tokens_estimados)
+                if espera <= 0:
+                    break
+                self._condicao.wait(timeout=espera)
+            self._requisicoes_disponiveis -= 1
+            self._tokens_disponiveis -= tokens_estimados
+            self._em_andamento += 1
+
+    def liberar(self, tokens_estimados, tokens_usados=None, cabecalhos=None):
+        """
+        Registra o fim de uma chamada bem-sucedida.
+        Args:
+            tokens_estimados (int): Tokens reservados em adquirir()
+            tokens_usados (int, optional): Tokens efetivamente consumidos (usage.total_tokens)
+            cabecalhos (Mapping, optional): Cabeçalhos HTTP da resposta
+        """
+        with self._condicao:
+            self._em_andamento = max(0, self._em_andamento - 1)
+            # Devolver (ou cobrar) a diferença entre o estimado e o consumido
+            if tokens_usados is not None:
+                self._tokens_disponiveis += tokens_estimados - tokens_usados
+            if cabecalhos is not None:
+                self._aprender_com_cabecalhos(cabecalhos)
+            self._condicao.notify_all()
+
+    def registrar_falha(self):
+        """Registra o fim de uma chamada que falhou por outro motivo que não o limite de taxa"""
+        with self._condicao:
+            self._em_andamento = max(0, self._em_andamento - 1)
+            self._condicao.notify_all()
+
+    def registrar_limite_excedido(self, cabecalhos=None):
+        """
+        Registra uma resposta 429: reduz a concorrência pela metade e pausa novas
+        chamadas pelo tempo indicado em retry-after.
+        Args:
+            cabecalhos (Mapping, optional): Cabeçalhos HTTP da resposta de erro
+        """
+        with self._condicao:
+            self._em_andamento = max(0, self._em_andamento - 1)
+            self.concorrencia = max(1, self.concorrencia // 2)
+            espera = None
+            if cabecalhos is not None:
+                espera_ms = _ler_numero(cabecalhos, 'retry-after-ms')
+                espera = espera_ms / 1000 if espera_ms is not None else _ler_numero(cabecalhos, 'retry-after')
+                self._aprender_com_cabecalhos(cabecalhos)
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + (espera if espera is not None else 1.0))
+            self._condicao.notify_all()
+
+    def _aprender_com_cabecalhos(self, cabecalhos):
+        """Ajusta limites, saldos e concorrência com base nos cabeçalhos x-ratelimit-* (deve ser chamado com o lock)"""
+        limite_requisicoes = _ler_numero(cabecalhos, 'x-ratelimit-limit-requests')
+        limite_tokens = _ler_numero(cabecalhos, 'x-ratelimit-limit-tokens')
+        restante_requisicoes = _ler_numero(cabecalhos, 'x-ratelimit-remaining-requests')
+        restante_tokens = _ler_numero(cabecalhos, 'x-ratelimit-remaining-tokens')
+        if limite_requisicoes:
+            self.requisicoes_por_minuto = limite_requisicoes
+        if limite_tokens:
+            self.tokens_por_minuto = limite_tokens
+        # O saldo do servidor prevalece sobre a estimativa local (outros processos usam a mesma conta)
+        if restante_requisicoes is not None:
+            self._requisicoes_disponiveis = min(self._requisicoes_disponiveis, restante_requisicoes)
+        if restante_tokens is not None:
+            self._tokens_disponiveis = min(self._tokens_disponiveis, restante_tokens)
+        # Ajustar a concorrência pela menor folga entre requisições e tokens
+        folgas = []
+        if restante_requisicoes is not None:
+            folgas.append(restante_requisicoes / self.requisicoes_por_minuto)
+        if restante_tokens is not None:
+            folgas.append(restante_tokens / self.tokens_por_minuto)
+        if folgas:
+            folga = min(folgas)
+            if folga < 0.1:
+                self.concorrencia = max(1, self.concorrencia - 1)
+            elif folga > 0.5:
+                self.concorrencia = min(self.concorrencia_maxima, self.concorrencia + 1)
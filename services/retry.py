@@ -0,0 +1,102 @@
+import random
+import threading
+from collections import deque
+import httpx
+from postgrest.exceptions import APIError
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    RateLimitError,
+)
+
+# Códigos HTTP que indicam falha transitória (vale a pena tentar de novo)
+STATUS_RECUPERAVEIS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def erro_recuperavel(erro):
+    """
+    Classifica um erro da API da OpenAI.
+    Limite de taxa, timeout, falha de conexão e erros 5xx são transitórios;
+    erros de requisição (400, 401, 403, 404, 422...) não mudam com uma nova tentativa.
+    Args:
+        erro (Exception): Erro levantado pela chamada
+    Returns:
+        bool: True se a chamada deve ser repetida
+    """
+    if isinstance(erro, (RateLimitError, APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(erro, APIStatusError):
+        return erro.status_code in STATUS_RECUPERAVEIS or erro.status_code >= 500
+    return False
+
+
+# Classes de SQLSTATE do Postgres que indicam que a linha foi rejeitada (dado
+# inválido, violação de restrição, coluna inexistente): repetir não adianta
+CLASSES_SQLSTATE_REJEICAO = {"22", "23", "42"}
+
+
+def erro_supabase_recuperavel(erro):
+    """
+    Classifica um erro do Supabase (PostgREST).
+    Só são definitivos os erros em que o banco rejeitou a requisição: respostas
+    4xx (exceto 408 e 429), erros de requisição do PostgREST (PGRST1xx e
+    PGRST2xx) e erros de dados ou de restrição do Postgres. Falhas de conexão,
+    timeouts, 5xx e qualquer erro não reconhecido são tratados como transitórios.
+    Args:
+        erro (Exception): Erro levantado pela chamada
+    Returns:
+        bool: True se a chamada deve ser repetida
+    """
+    if isinstance(erro, httpx.TransportError):
+        return True
+    if not isinstance(erro, APIError):
+        return True
+    codigo = str(erro.code or "")
+    if codigo.isdigit() and len(codigo) == 3:
+        # Resposta que não veio em JSON: o código é o status HTTP
+        status = int(codigo)
+        return status in STATUS_RECUPERAVEIS or status >= 500 or status < 400
+    if codigo.startswith("PGRST"):
+        return codigo[5:6] not in ("1", "2")
+    return codigo[:2] not in CLASSES_SQLSTATE_REJEICAO
+
+
+def tempo_espera(tentativa, base=1.0, maximo=30.0):
+    """
+    Calcula a espera antes de uma nova tentativa: backoff exponencial limitado,
+    com jitter completo para que chamadas simultâneas não voltem todas juntas.
+    Args:
+        tentativa (int): Número da tentativa que falhou (0 para a primeira)
+        base (float): Espera base em segundos
+        maximo (float): Espera máxima em segundos
+    Returns:
+        float: Segundos a aguardar
+    """
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+
+class HistoricoLatencia:
+    """Janela das latências mais recentes, usada para decidir quando duplicar uma chamada lenta"""
+
+    def __init__(self, tamanho=200, minimo_amostras=20):
+        self._latencias = deque(maxlen=tamanho)
+        self._minimo_amostras = minimo_amostras
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos):
+        """Adiciona a latência de uma chamada bem-sucedida"""
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def percentil(self, p):
+        """
+        Retorna o percentil p (0 a 100) das latências registradas.
+        Returns:
+            float: Latência em segundos, ou None se ainda não houver amostras suficientes
+        """
+        with self._lock:
+            if len(self._latencias) < self._minimo_amostras:
+                return None
+            ordenadas = sorted(self._latencias)
+        return ordenadas[int(round(p / 100 * (len(ordenadas) - 1)))]
@@ -1,17 +1,95 @@
 import streamlit as st
+import hashlib
 import os
-from supabase import create_client, Client
+import re
+import threading
+import httpx
+from cachetools import TTLCache
+from postgrest.utils import SyncClient
+from supabase import create_client, Client, ClientOptions
+from services.retry import erro_supabase_recuperavel
 
 # Inicializar cliente Supabase
 SUPABASE_URL = st.secrets["SUPABASE_URL"]
 SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
 SUPABASE_SERVICE_KEY = st.secrets["SUPABASE_SERVICE_KEY"]
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Configuração das conexões HTTP reaproveitadas pelos clientes compartilhados
+SUPABASE_TIMEOUT = float(st.secrets.get("SUPABASE_TIMEOUT", 30))
+SUPABASE_MAX_CONEXOES = int(st.secrets.get("SUPABASE_MAX_CONEXOES", 20))
+SUPABASE_MAX_CONEXOES_OCIOSAS = int(st.secrets.get("SUPABASE_MAX_CONEXOES_OCIOSAS", 10))
+
+def _criar_cliente(chave):
+    """
+    Cria um cliente Supabase com timeout e pool de conexões configurados.
+    Args:
+        chave (str): Chave anônima ou de serviço
+    Returns:
+        Client: Cliente Supabase
+    """
+    opcoes = ClientOptions(
+        postgrest_client_timeout=SUPABASE_TIMEOUT,
+        auto_refresh_token=False,
+        persist_session=False
+    )
+    cliente = create_client(SUPABASE_URL, chave, options=opcoes)
+    # Trocar a sessão HTTP do PostgREST por uma com limites de pool configuráveis;
+    # a sessão mantém as conexões abertas (keep-alive) entre as chamadas
+    postgrest = cliente.postgrest
+    sessao_original = postgrest.session
+    postgrest.session = SyncClient(
+        base_url=sessao_original.base_url,
+        headers=sessao_original.headers,
+        timeout=SUPABASE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONEXOES,
+            max_keepalive_connections=SUPABASE_MAX_CONEXOES_OCIOSAS
+        ),
+        follow_redirects=True,
+        http2=True
+    )
+    sessao_original.close()
+    return cliente
+
+@st.cache_resource
+def _cliente_anonimo():
+    """Cliente com a chave anônima, compartilhado por todo o processo"""
+    return _criar_cliente(SUPABASE_KEY)
+
+@st.cache_resource
+def _cliente_servico():
+    """Cliente com a chave de serviço, compartilhado por todo o processo"""
+    return _criar_cliente(SUPABASE_SERVICE_KEY)
+
+supabase: Client = _cliente_anonimo()
+
+# Número máximo de questões enviadas em cada insert em bloco
+TAMANHO_BLOCO_INSERCAO = int(st.secrets.get("SUPABASE_TAMANHO_BLOCO", 500))
+# Número de usuários por página nas consultas à API Admin do Supabase Auth
+TAMANHO_PAGINA_ADMIN = 1000
+# Número máximo de combinações de matéria consultadas em cada select em bloco
+TAMANHO_BLOCO_MATERIAS = 100
+# Número máximo de questões que casam com uma busca textual ordenadas por relevância
+MAX_CANDIDATOS_BUSCA = int(st.secrets.get("BUSCA_MAX_CANDIDATOS", 1000))
+
+# Cache em processo de (materia, tema, subtema, assunto) -> id da matéria
+_cache_materias = TTLCache(
+    maxsize=int(st.secrets.get("CACHE_MATERIAS_MAX_ENTRADAS", 10000)),
+    ttl=int(st.secrets.get("CACHE_MATERIAS_TTL", 3600))
+)
+_lock_cache_materias = threading.Lock()
+
+# Cache em processo das estatísticas do dashboard, por usuário
+_cache_estatisticas = TTLCache(maxsize=1000, ttl=int(st.secrets.get("CACHE_ESTATISTICAS_TTL", 300)))
+_lock_cache_estatisticas = threading.Lock()
 
 def get_supabase_connection(admin=False):
     """Retorna uma conexão com o Supabase real
     
+    Os clientes são criados uma única vez por processo e reaproveitados, junto
+    com suas conexões HTTP. Não use estes clientes para login: o estado de
+    autenticação seria compartilhado entre usuários (veja criar_cliente_sessao).
+    
     Args:
         admin (bool, optional): Se True, usará a chave de serviço para operações administrativas.
         
@@ -19,10 +97,16 @@ def get_supabase_connection(admin=False):
         Client: Cliente de conexão com o Supabase
     """
     if admin:
-        supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    else:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    return supabase
+        return _cliente_servico()
+    return _cliente_anonimo()
+
+def criar_cliente_sessao():
+    """Cria um cliente exclusivo para a sessão do navegador, usado no login e logout
+    
+    Returns:
+        Client: Cliente de conexão com o Supabase
+    """
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def obter_materia_id(materia, tema, subtema, assunto):
     """
@@ -38,48 +122,237 @@ def obter_materia_id(materia, tema, subtema, assunto):
     Returns:
         int: ID da matéria encontrada ou criada
     """
-    # Primeiro, verificar se já existe uma matéria com esses dados
     try:
-        # Realizar a consulta para verificar se a matéria existe
-        query = (
+        chave = _normalizar_chave_materia((materia, tema, subtema, assunto))
+        ids = resolver_ids_materias([chave])
+        if chave not in ids:
+            raise Exception("Falha ao inserir novo registro de matéria")
+        return ids[chave]
+    except Exception as e:
+        # Registrar o erro e propagar a exceção
+        print(f"Erro ao obter ou criar matéria: {str(e)}")
+        raise e
+
+def _normalizar_chave_materia(chave):
+    """Converte as partes de uma tupla (materia, tema, subtema, assunto) em texto (None vira "")"""
+    return tuple("" if parte is None else str(parte) for parte in chave)
+
+def resolver_ids_materias(chaves):
+    """
+    Resolve os IDs de várias matérias de uma vez, criando as que não existem.
+    Consulta primeiro o cache em processo; as combinações restantes são buscadas
+    em um único select por bloco e as que faltarem são criadas com um upsert
+    (on_conflict no índice único de materias), o que evita duplicatas quando
+    várias sessões salvam ao mesmo tempo.
+
+    Args:
+        chaves (list): Lista de tuplas (materia, tema, subtema, assunto)
+    Returns:
+        dict: Mapeamento de cada tupla para o ID da matéria
+    """
+    ids = {}
+    faltantes = []
+    # As colunas de materias são texto: números vindos da planilha (ex.: assunto 1964)
+    # precisam virar texto antes da consulta, senão nunca casam com o que o banco devolve
+    chaves = [_normalizar_chave_materia(chave) for chave in chaves]
+    with _lock_cache_materias:
+        for chave in dict.fromkeys(chaves):
+            if chave in _cache_materias:
+                ids[chave] = _cache_materias[chave]
+            else:
+                faltantes.append(chave)
+    if not faltantes:
+        return ids
+
+    encontrados = {}
+    # Buscar as combinações existentes (o filtro por coluna é um superconjunto; a conferência exata é feita aqui)
+    for inicio in range(0, len(faltantes), TAMANHO_BLOCO_MATERIAS):
+        bloco = faltantes[inicio:inicio + TAMANHO_BLOCO_MATERIAS]
+        resultado = (
             supabase.table("materias")
-            .select("id")
-            .eq("materia", materia)
-            .eq("tema", tema)
-            .eq("subtema", subtema)
-            .eq("assunto", assunto)
+            .select("id, materia, tema, subtema, assunto")
+            .in_("materia", list({chave[0] for chave in bloco}))
+            .in_("tema", list({chave[1] for chave in bloco}))
+            .in_("subtema", list({chave[2] for chave in bloco}))
+            .in_("assunto", list({chave[3] for chave in bloco}))
+            .execute()
         )
-        
-        resultado = query.execute()
-        
-        # Se encontrou pelo menos um registro
-        if resultado.data and len(resultado.data) > 0:
-            return resultado.data[0]["id"]
-            
-        # Se não encontrou, criar um novo registro
-        novo_registro = {
-            "materia": materia,
-            "tema": tema,
-            "subtema": subtema,
-            "assunto": assunto
-        }
-        
-        resultado_insercao = (
+        procurados = set(bloco)
+        for linha in resultado.data or []:
+            chave = _normalizar_chave_materia((linha["materia"], linha["tema"], linha["subtema"], linha["assunto"]))
+            if chave in procurados:
+                encontrados.setdefault(chave, linha["id"])
+
+    # Criar as que ainda não existem
+    novas = [chave for chave in faltantes if chave not in encontrados]
+    if novas:
+        resultado = (
             supabase.table("materias")
-            .insert(novo_registro)
+            .upsert(
+                [{"materia": m, "tema": t, "subtema": s, "assunto": a} for m, t, s, a in novas],
+                on_conflict="materia,tema,subtema,assunto"
+            )
             .execute()
         )
-        
-        # Retornar o ID do registro inserido
-        if resultado_insercao.data and len(resultado_insercao.data) > 0:
-            return resultado_insercao.data[0]["id"]
-        else:
-            raise Exception("Falha ao inserir novo registro de matéria")
-            
+        for linha in resultado.data or []:
+            encontrados[_normalizar_chave_materia((linha["materia"], linha["tema"], linha["subtema"], linha["assunto"]))] = linha["id"]
+
+    with _lock_cache_materias:
+        _cache_materias.update(encontrados)
+    ids.update(encontrados)
+    return ids
+
+def _remover_letra_alternativa(texto):
+    """Remove a letra do início da alternativa, ex: "A) Alternativa 1" -> "Alternativa 1" """
+    if len(texto) > 3 and texto[0].isalpha() and texto[1:3] == ") ":
+        return texto[3:]
+    return texto
+
+# Espaços considerados na normalização: os mesmos de normalizar_texto_questao no
+# banco (str.split() do Python também separaria em espaços Unicode, como o \xa0)
+_ESPACOS = " \t\n\r\f\v"
+_RE_ESPACOS = re.compile(f"[{_ESPACOS}]+")
+
+def _normalizar_texto(texto):
+    """Normaliza um texto para o hash de conteúdo: sem espaços repetidos ou nas pontas, em minúsculas"""
+    texto = "" if texto is None else str(texto)
+    return _RE_ESPACOS.sub(" ", texto.strip(_ESPACOS)).lower()
+
+def hash_conteudo_questao(registro, chave_materia):
+    """
+    Calcula o hash de conteúdo de uma questão, usado como chave única da tabela
+    questoes para que salvar a mesma questão de novo não crie outra linha. A
+    mesma fórmula é usada no preenchimento das linhas antigas (migração
+    questoes_hash_conteudo), então as duas precisam mudar juntas.
+    Args:
+        registro (dict): Registro montado por _montar_registro_questao
+        chave_materia (tuple): (materia, tema, subtema, assunto)
+    Returns:
+        str: Hash SHA-256 em hexadecimal
+    """
+    partes = [
+        registro.get("enunciado"),
+        registro.get("alternativa1"),
+        registro.get("alternativa2"),
+        registro.get("alternativa3"),
+        registro.get("alternativa4"),
+        registro.get("alternativa5"),
+        registro.get("gabarito"),
+        *chave_materia
+    ]
+    texto = "\x1f".join(_normalizar_texto(parte) for parte in partes)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def _chave_materia(questao):
+    """Retorna a tupla (materia, tema, subtema, assunto) dos metadados da questão"""
+    metadados = questao.get('metadados', {})
+    return _normalizar_chave_materia((
+        metadados.get('materia', ''),
+        metadados.get('tema', ''),
+        metadados.get('subtema', ''),
+        metadados.get('assunto', '')
+    ))
+
+def _montar_registro_questao(questao, id_materia, user_id=None):
+    """
+    Monta o registro da tabela questoes a partir de uma questão gerada.
+    Args:
+        questao (dict): Dicionário com os dados da questão
+        id_materia (int): ID da matéria da questão
+        user_id (str, optional): ID do usuário que está salvando
+    Returns:
+        dict: Registro pronto para inserção
+    """
+    metadados = questao.get('metadados', {})
+    registro_questao = {
+        "codigo": metadados.get('codigo', ''),
+        "enunciado": questao.get('enunciado', ''),
+        "alternativa1": _remover_letra_alternativa(questao.get('alternativa1', '')),
+        "alternativa2": _remover_letra_alternativa(questao.get('alternativa2', '')),
+        "alternativa3": _remover_letra_alternativa(questao.get('alternativa3', '')),
+        "alternativa4": _remover_letra_alternativa(questao.get('alternativa4', '')),
+        "alternativa5": _remover_letra_alternativa(questao.get('alternativa5', '')),
+        "gabarito": _remover_letra_alternativa(questao.get('gabarito', '')),
+        "resolucao": questao.get('resolucao', ''),
+        "dificuldade": metadados.get('dificuldade', ''),
+        "id_materia": id_materia
+    }
+    registro_questao["hash_conteudo"] = hash_conteudo_questao(registro_questao, _chave_materia(questao))
+    # Adicionar o ID do usuário que está criando a questão, se fornecido
+    if user_id:
+        registro_questao["id_user"] = user_id
+    return registro_questao
+
+def _adicionar_letra_alternativa(texto, letra):
+    """Adiciona a letra no início da alternativa, ex: "Alternativa 1" -> "A) Alternativa 1" """
+    return f"{letra}) {texto}" if texto else texto
+
+def buscar_questoes_existentes(itens, dificuldade):
+    """
+    Procura no banco questões já salvas para os itens de um arquivo, para que
+    sejam reaproveitadas em vez de geradas de novo. Todos os itens são
+    consultados de uma vez pela função buscar_questoes_existentes do banco;
+    itens repetidos recebem questões diferentes enquanto houver.
+
+    Args:
+        itens (list): Itens (linhas do arquivo) com materia, tema, subtema e assunto
+        dificuldade (str): Nível de dificuldade das questões
+    Returns:
+        list: Para cada item, na mesma ordem, a questão encontrada (no formato das
+            questões geradas, com metadados) ou None
+    """
+    chaves = [tuple(str(item.get(campo, '')) for campo in ('materia', 'tema', 'subtema', 'assunto')) for item in itens]
+    quantidades = {}
+    for chave in chaves:
+        quantidades[chave] = quantidades.get(chave, 0) + 1
+    if not quantidades:
+        return []
+
+    try:
+        linhas = supabase.rpc('buscar_questoes_existentes', {
+            'p_itens': [
+                {"materia": m, "tema": t, "subtema": s, "assunto": a, "quantidade": quantidade}
+                for (m, t, s, a), quantidade in quantidades.items()
+            ],
+            'p_dificuldade': dificuldade
+        }).execute().data or []
     except Exception as e:
-        # Registrar o erro e propagar a exceção
-        print(f"Erro ao obter ou criar matéria: {str(e)}")
-        raise e
+        print(f"Erro ao buscar questões existentes: {str(e)}")
+        return [None] * len(itens)
+
+    encontradas = {}
+    for linha in linhas:
+        alternativas = [linha.get(f"alternativa{numero}") or "" for numero in range(1, 6)]
+        questao = {"enunciado": linha.get("enunciado") or ""}
+        for numero, (letra, texto) in enumerate(zip("ABCDE", alternativas), start=1):
+            questao[f"alternativa{numero}"] = _adicionar_letra_alternativa(texto, letra)
+        gabarito = linha.get("gabarito") or ""
+        questao["gabarito"] = next(
+            (_adicionar_letra_alternativa(texto, letra) for letra, texto in zip("ABCDE", alternativas) if texto == gabarito),
+            gabarito
+        )
+        questao["resolucao"] = linha.get("resolucao") or ""
+        chave = (linha["materia"], linha["tema"], linha["subtema"], linha["assunto"])
+        encontradas.setdefault(chave, []).append(questao)
+
+    resultado = []
+    for item, chave in zip(itens, chaves):
+        disponiveis = encontradas.get(chave)
+        if not disponiveis:
+            resultado.append(None)
+            continue
+        questao = disponiveis.pop(0)
+        questao["metadados"] = {
+            "codigo": item.get('codigo', ''),
+            "materia": item.get('materia', ''),
+            "tema": item.get('tema', ''),
+            "subtema": item.get('subtema', ''),
+            "assunto": item.get('assunto', ''),
+            "dificuldade": dificuldade
+        }
+        questao["reaproveitada"] = True
+        resultado.append(questao)
+    return resultado
 
 def salvar_questao(questao, user_id=None):
     """
@@ -103,62 +376,86 @@ def salvar_questao(questao, user_id=None):
             metadados.get('assunto', '')
         )
         
-        # Extrair alternativas (remover a letra do início, ex: "A) Alternativa 1" -> "Alternativa 1")
-        alternativa1 = questao.get('alternativa1', '')
-        if len(alternativa1) > 3 and alternativa1[0].isalpha() and alternativa1[1:3] == ") ":
-            alternativa1 = alternativa1[3:]
-        alternativa2 = questao.get('alternativa2', '')
-        if len(alternativa2) > 3 and alternativa2[0].isalpha() and alternativa2[1:3] == ") ":
-            alternativa2 = alternativa2[3:]
-        alternativa3 = questao.get('alternativa3', '')
-        if len(alternativa3) > 3 and alternativa3[0].isalpha() and alternativa3[1:3] == ") ":
-            alternativa3 = alternativa3[3:]
-        alternativa4 = questao.get('alternativa4', '')
-        if len(alternativa4) > 3 and alternativa4[0].isalpha() and alternativa4[1:3] == ") ":
-            alternativa4 = alternativa4[3:]
-        alternativa5 = questao.get('alternativa5', '')
-        if len(alternativa5) > 3 and alternativa5[0].isalpha() and alternativa5[1:3] == ") ":
-            alternativa5 = alternativa5[3:]
-        gabarito = questao.get('gabarito', '')
-        if len(gabarito) > 3 and gabarito[0].isalpha() and gabarito[1:3] == ") ":
-            gabarito = gabarito[3:] 
-
         # Preparar o registro para inserção
-        registro_questao = {
-            "codigo": metadados.get('codigo', ''),
-            "enunciado": questao.get('enunciado', ''),
-            "alternativa1": alternativa1,
-            "alternativa2": alternativa2,
-            "alternativa3": alternativa3,
-            "alternativa4": alternativa4,
-            "alternativa5": alternativa5,
-            "gabarito": gabarito,
-            "resolucao": questao.get('resolucao', ''),
-            "dificuldade": metadados.get('dificuldade', ''),
-            "id_materia": id_materia
-        }
-        # Adicionar o ID do usuário que está criando a questão, se fornecido
-        if user_id:
-            registro_questao["id_user"] = user_id
+        registro_questao = _montar_registro_questao(questao, id_materia, user_id)
         
-        # Inserir na tabela questoes
-        resultado = (
-            supabase.table("questoes")
-            .insert(registro_questao)
-            .execute()
-        )
-
-        # Verificar se a inserção foi bem-sucedida
-        if resultado.data and len(resultado.data) > 0:
-            return True
-        else:
-            return False  
+        # Inserir na tabela questoes (se a questão já estiver salva, nada muda)
+        supabase.table("questoes").upsert(
+            registro_questao, on_conflict="hash_conteudo", ignore_duplicates=True
+        ).execute()
+        return True
            
     except Exception as e:
         # Registrar o erro
         print(f"Erro ao salvar questão: {str(e)}")
         return False
 
+def salvar_questoes_em_lote(questoes, user_id=None):
+    """
+    Salva uma lista de questões com o mínimo de chamadas ao banco: os IDs das
+    matérias são resolvidos em bloco (resolver_ids_materias) e as questões são
+    inseridas em blocos de TAMANHO_BLOCO_INSERCAO linhas. Se um bloco falhar,
+    suas linhas são inseridas uma a uma para identificar quais falharam.
+    Questões já salvas (mesmo hash de conteúdo) são ignoradas e contam como
+    sucesso, então repetir o salvamento não duplica linhas.
+
+    Args:
+        questoes (list): Lista de questões
+        user_id (str, optional): ID do usuário que está salvando
+    Returns:
+        list: Um dicionário por questão, na mesma ordem, com 'sucesso' (bool), 'erro'
+            (str ou None) e 'recuperavel' (bool: se a falha é transitória e vale
+            tentar de novo, ver erro_supabase_recuperavel)
+    """
+    resultados = [{"sucesso": False, "erro": None, "recuperavel": True} for _ in questoes]
+
+    # Resolver os IDs de todas as matérias de uma vez
+    try:
+        ids_materias = resolver_ids_materias([_chave_materia(questao) for questao in questoes])
+        erro_materias = "matéria não encontrada nem criada"
+        materias_recuperavel = True
+    except Exception as e:
+        print(f"Erro ao obter ou criar matérias: {str(e)}")
+        ids_materias = {}
+        erro_materias = str(e)
+        materias_recuperavel = erro_supabase_recuperavel(e)
+
+    # Montar os registros das questões cuja matéria foi resolvida
+    registros = []
+    for indice, questao in enumerate(questoes):
+        chave = _chave_materia(questao)
+        if chave not in ids_materias:
+            resultados[indice]["erro"] = f"Erro ao obter matéria: {erro_materias}"
+            resultados[indice]["recuperavel"] = materias_recuperavel
+            continue
+        registros.append((indice, _montar_registro_questao(questao, ids_materias[chave], user_id)))
+
+    # Inserir em blocos
+    for inicio in range(0, len(registros), TAMANHO_BLOCO_INSERCAO):
+        bloco = registros[inicio:inicio + TAMANHO_BLOCO_INSERCAO]
+        try:
+            (
+                supabase.table("questoes")
+                .upsert([registro for _, registro in bloco], on_conflict="hash_conteudo", ignore_duplicates=True)
+                .execute()
+            )
+            for indice, _ in bloco:
+                resultados[indice] = {"sucesso": True, "erro": None, "recuperavel": True}
+        except Exception as erro_bloco:
+            print(f"Erro ao salvar bloco de questões, salvando uma a uma: {str(erro_bloco)}")
+            for indice, registro in bloco:
+                try:
+                    supabase.table("questoes").upsert(
+                        registro, on_conflict="hash_conteudo", ignore_duplicates=True
+                    ).execute()
+                    resultados[indice] = {"sucesso": True, "erro": None, "recuperavel": True}
+                except Exception as e:
+                    print(f"Erro ao salvar questão: {str(e)}")
+                    resultados[indice]["erro"] = str(e)
+                    resultados[indice]["recuperavel"] = erro_supabase_recuperavel(e)
+
+    return resultados
+
 def salvar_questoes_aprovadas(questoes, user_id=None):
     """
     Salva uma lista de questões aprovadas no banco de dados.
@@ -168,16 +465,122 @@ def salvar_questoes_aprovadas(questoes, user_id=None):
     Returns:
         tuple: (número de questões salvas com sucesso, número total de questões)
     """
-    # Contar questões salvas com sucesso
-    questoes_salvas = 0
-    total_questoes = len(questoes)
+    resultados = salvar_questoes_em_lote(questoes, user_id)
+    questoes_salvas = sum(1 for resultado in resultados if resultado["sucesso"])
+    return (questoes_salvas, len(questoes))
+
+def _resumo_questoes():
+    """
+    Retorna as contagens de todo o banco (total, por matéria e por dificuldade),
+    iguais para todos os usuários e por isso guardadas em cache uma única vez.
+    Returns:
+        dict: 'total' (int), e 'por_materia' e 'por_dificuldade' (dicionários
+            nome -> quantidade, vazios se a função não existir no banco)
+    """
+    with _lock_cache_estatisticas:
+        if "resumo" in _cache_estatisticas:
+            return _cache_estatisticas["resumo"]
+
+    try:
+        linhas = supabase.rpc('resumo_questoes').execute().data or []
+        resumo = {"total": 0, "por_materia": {}, "por_dificuldade": {}}
+        for linha in linhas:
+            resumo["total"] += linha["total"]
+            materia = linha["materia"] or "Sem matéria"
+            dificuldade = linha["dificuldade"] or "Não informada"
+            resumo["por_materia"][materia] = resumo["por_materia"].get(materia, 0) + linha["total"]
+            resumo["por_dificuldade"][dificuldade] = resumo["por_dificuldade"].get(dificuldade, 0) + linha["total"]
+    except Exception as rpc_error:
+        print(f"Função resumo_questoes indisponível, usando contagens simples: {str(rpc_error)}")
+        # Sem a função no banco, contar com uma consulta que devolve só o total (head)
+        total = supabase.table("questoes").select("id", count="exact", head=True).execute().count
+        resumo = {"total": total or 0, "por_materia": {}, "por_dificuldade": {}}
+
+    with _lock_cache_estatisticas:
+        _cache_estatisticas["resumo"] = resumo
+    return resumo
+
+def _contar_questoes_usuario(user_id):
+    """Conta as questões salvas por um usuário (pelo índice de id_user), com cache por usuário"""
+    chave = ("usuario", user_id)
+    with _lock_cache_estatisticas:
+        if chave in _cache_estatisticas:
+            return _cache_estatisticas[chave]
+    total = (
+        supabase.table("questoes")
+        .select("id", count="exact", head=True)
+        .eq("id_user", user_id)
+        .execute()
+        .count
+    ) or 0
+    with _lock_cache_estatisticas:
+        _cache_estatisticas[chave] = total
+    return total
+
+def obter_estatisticas_questoes(user_id=None):
+    """
+    Retorna as estatísticas do banco de questões para o dashboard. As contagens
+    são feitas no banco e nenhuma linha de questoes é transferida: o resumo de
+    todo o banco (função resumo_questoes, agrupada por matéria e dificuldade) é
+    calculado uma vez para todos os usuários, e a contagem do usuário é uma
+    consulta à parte pelo índice de id_user. Os resultados ficam em cache por
+    CACHE_ESTATISTICAS_TTL segundos.
 
-    # Para cada questão, tentar salvar
-    for questao in questoes:
-        if salvar_questao(questao, user_id):
-            questoes_salvas += 1
+    Args:
+        user_id (str, optional): ID do usuário para a contagem das suas questões
+    Returns:
+        dict: 'total' e 'do_usuario' (int), e 'por_materia' e 'por_dificuldade'
+            (dicionários nome -> quantidade, vazios se a função não existir no banco)
+    """
+    resumo = _resumo_questoes()
+    return {**resumo, "do_usuario": _contar_questoes_usuario(user_id) if user_id else 0}
 
-    return (questoes_salvas, total_questoes)
+def buscar_questoes_banco(consulta, limite=20, deslocamento=0):
+    """
+    Busca textual nas questões salvas (enunciado, alternativas e resolução), com
+    stemming em português e ordenação por relevância. A busca é feita no banco
+    (função buscar_questoes, sobre o índice GIN da coluna busca) e só as linhas
+    da página são transferidas. Para termos muito comuns, apenas as
+    MAX_CANDIDATOS_BUSCA questões mais recentes que casam são ordenadas por relevância.
+
+    Args:
+        consulta (str): Texto buscado; aceita "frase exata", OR e -termo
+        limite (int, optional): Número máximo de resultados
+        deslocamento (int, optional): Número de resultados a pular (paginação)
+    Returns:
+        list: Dicionários com id, enunciado, gabarito, dificuldade, materia, tema,
+            subtema, assunto e trecho (enunciado com os termos encontrados em negrito)
+    """
+    if not consulta or not consulta.strip():
+        return []
+    try:
+        return supabase.rpc('buscar_questoes', {
+            'p_consulta': consulta,
+            'p_limite': limite,
+            'p_deslocamento': deslocamento,
+            'p_max_candidatos': MAX_CANDIDATOS_BUSCA
+        }).execute().data or []
+    except Exception as rpc_error:
+        print(f"Função buscar_questoes indisponível, usando o filtro de texto: {str(rpc_error)}")
+    # Sem a função no banco, filtrar pela coluna busca (ainda pelo índice, mas sem ordenar por relevância)
+    resultado = (
+        supabase.table("questoes")
+        .select("id, enunciado, gabarito, dificuldade, materias(materia, tema, subtema, assunto)")
+        .range(deslocamento, deslocamento + limite - 1)
+        .text_search("busca", consulta, options={"config": "portuguese", "type": "web_search"})
+        .execute()
+    )
+    return [
+        {
+            "id": linha["id"],
+            "enunciado": linha["enunciado"],
+            "gabarito": linha["gabarito"],
+            "dificuldade": linha["dificuldade"],
+            **(linha.get("materias") or {}),
+            "trecho": linha["enunciado"]
+        }
+        for linha in resultado.data or []
+    ]
 
 def is_admin_user(user_id):
     """
@@ -203,34 +606,67 @@ def is_admin_user(user_id):
         print(f"Erro ao verificar perfil admin: {str(e)}")
         return False
 
-def listar_usuarios():
+def listar_usuarios(pagina=1, por_pagina=50, busca=None, perfil=None, confirmado=None):
     """
-    Lista todos os usuários cadastrados no sistema, combinando informações da
-    tabela de autenticação e da tabela de perfis.
+    Lista uma página dos usuários cadastrados no sistema, combinando informações
+    da tabela de autenticação e da tabela de perfis. A paginação, a busca e os
+    filtros são feitos no banco pela função listar_usuarios_paginado, então só
+    as linhas da página são transferidas.
+    
+    Args:
+        pagina (int, optional): Número da página (começando em 1)
+        por_pagina (int, optional): Número de usuários por página
+        busca (str, optional): Trecho do email, nome ou nome de usuário
+        perfil (str, optional): Filtrar pelo perfil ('admin' ou 'user')
+        confirmado (bool, optional): Filtrar pelo status de confirmação do email
     
     Returns:
-        list: Lista de usuários com seus dados
+        tuple: (lista de usuários da página, total de usuários encontrados ou None se desconhecido)
     """
     # Conectar ao Supabase com permissões de admin
     client = get_supabase_connection(admin=True)
     
-    # Método 1: Tentar obter a lista de usuários diretamente via API Admin do Supabase
     try:
-        # Obter todos os usuários do sistema
-        auth_users = client.auth.admin.list_users()
-        
-        # Obter os perfis dos usuários
-        profiles_response = client.table('profiles').select('*').execute()
-        profiles_by_id = {profile['id']: profile for profile in profiles_response.data}
+        resposta = client.rpc('listar_usuarios_paginado', {
+            'p_busca': busca or None,
+            'p_perfil': perfil,
+            'p_confirmado': confirmado,
+            'p_limite': por_pagina,
+            'p_deslocamento': (pagina - 1) * por_pagina
+        }).execute()
+        linhas = resposta.data or []
+        usuarios = [
+            {
+                "id": linha["id"],
+                "nome": linha.get("nome") or "Não informado",
+                "username": linha.get("username") or "Não informado",
+                "email": linha["email"],
+                "perfil": linha.get("perfil") or "user",
+                "avatar_url": linha.get("avatar_url"),
+                "criado_em": linha["criado_em"],
+                "confirmado": linha["confirmado"]
+            }
+            for linha in linhas
+        ]
+        total = linhas[0]["total"] if linhas else (0 if pagina == 1 else None)
+        return usuarios, total
+    except Exception as rpc_error:
+        print(f"Função listar_usuarios_paginado indisponível, usando a API Admin: {str(rpc_error)}")
+    
+    # Sem a função no banco, a busca e os filtros não podem ser feitos no servidor
+    if busca or perfil or confirmado is not None:
+        raise Exception("A busca e os filtros exigem a função listar_usuarios_paginado no banco de dados.")
+    try:
+        # Obter apenas a página pedida da API Admin e os perfis desses usuários
+        user_list = client.auth.admin.list_users(page=pagina, per_page=por_pagina)
+        ids = [user.id for user in user_list]
+        profiles_by_id = {}
+        if ids:
+            profiles_response = client.table('profiles').select('*').in_('id', ids).execute()
+            profiles_by_id = {profile['id']: profile for profile in profiles_response.data}
         
         # Combinar os dados
         usuarios = []
-        # Verificar o formato do resultado (pode ser um objeto com propriedade 'users' ou uma lista direta)
-        if hasattr(auth_users, 'users'):
-            user_list = auth_users.users
-        else:
-            user_list = auth_users
-            
         for user in user_list:
             user_id = user.id
             profile = profiles_by_id.get(user_id, {})
@@ -246,9 +682,40 @@ def listar_usuarios():
                 "confirmado": user.email_confirmed_at is not None
             })
             
-        return usuarios
+        return usuarios, None
     except Exception as api_error:
         print(f"Erro ao listar usuários via API: {str(api_error)}")
+        raise
+
+def buscar_usuario_id_por_email(email):
+    """
+    Busca o ID de um usuário pelo email.
+    Usa a função buscar_usuario_por_email do banco, que consulta auth.users pelo
+    índice de email (apenas usuários que não são de SSO). Se a função ainda não existir no banco, percorre a lista de
+    usuários da API Admin página a página.
+    
+    Args:
+        email (str): Endereço de email do usuário
+        
+    Returns:
+        str: ID do usuário, ou None se não existir
+    """
+    client = get_supabase_connection(admin=True)
+    email = email.strip().lower()
+    try:
+        resposta = client.rpc('buscar_usuario_por_email', {'p_email': email}).execute()
+        return resposta.data or None
+    except Exception as rpc_error:
+        print(f"Função buscar_usuario_por_email indisponível, buscando pela API Admin: {str(rpc_error)}")
+    pagina = 1
+    while True:
+        usuarios = client.auth.admin.list_users(page=pagina, per_page=TAMANHO_PAGINA_ADMIN)
+        for user in usuarios:
+            if (user.email or '').lower() == email:
+                return user.id
+        if len(usuarios) < TAMANHO_PAGINA_ADMIN:
+            return None
+        pagina += 1
 
 def criar_usuario(nome, email, senha, perfil="user", username=None):
     """
@@ -273,28 +740,17 @@ def criar_usuario(nome, email, senha, perfil="user", username=None):
         if not username:
             username = email.split('@')[0]
         
-        # Verificar se o usuário já existe
-        user_exists = False
-        existing_user = None
-        
-        # Método 1: Tentar obter todos os usuários e filtrar por email
+        # Verificar se o usuário já existe (busca indexada por email)
+        existing_user_id = None
         try:
-            all_users = client.auth.admin.list_users()
-            user_list = all_users.users if hasattr(all_users, 'users') else all_users
-            
-            for user in user_list:
-                if user.email == email:
-                    existing_user = [user]
-                    user_exists = True
-                    break
+            existing_user_id = buscar_usuario_id_por_email(email)
         except Exception as verify_error:
-            # Se houver erro na verificação, vamos tentar o método alternativo
             print(f"Erro ao verificar usuário: {str(verify_error)}")
 
         # Processar a criação ou atualização do usuário
-        if user_exists and existing_user:
+        if existing_user_id:
             # Atualizar o usuário existente
-            user_id = existing_user[0].id
+            user_id = existing_user_id
             
             # Atualizar a senha se foi fornecida
             if senha:
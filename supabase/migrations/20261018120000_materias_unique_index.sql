@@ -0,0 +1,24 @@
+-- Índice único de matérias, usado pelo upsert (on_conflict) de resolver_ids_materias
+-- para que sessões simultâneas não criem a mesma matéria duas vezes.
+
+-- Remover matérias duplicadas, mantendo o menor id e reapontando as questões
+with duplicadas as (
+    select id, min(id) over (partition by materia, tema, subtema, assunto) as id_mantido
+    from public.materias
+)
+update public.questoes q
+set id_materia = d.id_mantido
+from duplicadas d
+where q.id_materia = d.id
+  and d.id <> d.id_mantido;
+
+delete from public.materias m
+using (
+    select id, min(id) over (partition by materia, tema, subtema, assunto) as id_mantido
+    from public.materias
+) d
+where m.id = d.id
+  and d.id <> d.id_mantido;
+
+create unique index if not exists materias_materia_tema_subtema_assunto_key
+    on public.materias (materia, tema, subtema, assunto);
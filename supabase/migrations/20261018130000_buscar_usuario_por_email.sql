@@ -0,0 +1,23 @@
+-- Busca de usuário por email usada por criar_usuario, em vez de percorrer a
+-- lista completa da API Admin. O GoTrue grava os emails em minúsculas, e o
+-- único índice de email de auth.users (users_email_partial_key) é parcial, com
+-- "where is_sso_user = false": o filtro abaixo repete essa condição para que o
+-- planejador possa usá-lo. Usuários de SSO podem repetir o email e não são
+-- criados por este aplicativo, então ficam de fora.
+create or replace function public.buscar_usuario_por_email(p_email text)
+returns uuid
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select id
+    from auth.users
+    where email = lower(p_email)
+      and is_sso_user = false
+    limit 1;
+$$;
+
+-- Apenas a chave de serviço pode consultar usuários por email
+revoke all on function public.buscar_usuario_por_email(text) from public, anon, authenticated;
+grant execute on function public.buscar_usuario_por_email(text) to service_role;
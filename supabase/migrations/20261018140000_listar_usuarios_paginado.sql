@@ -0,0 +1,55 @@
+-- Listagem paginada de usuários para a página de administração: junta auth.users
+-- e profiles no banco, aplica busca e filtros e devolve só a página pedida, com o
+-- total de usuários encontrados em cada linha.
+create or replace function public.listar_usuarios_paginado(
+    p_busca text default null,
+    p_perfil text default null,
+    p_confirmado boolean default null,
+    p_limite integer default 50,
+    p_deslocamento integer default 0
+)
+returns table (
+    id uuid,
+    email text,
+    criado_em timestamptz,
+    confirmado boolean,
+    nome text,
+    username text,
+    perfil text,
+    avatar_url text,
+    total bigint
+)
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select
+        u.id,
+        u.email::text,
+        u.created_at,
+        u.email_confirmed_at is not null,
+        p.full_name,
+        p.username,
+        coalesce(p.role, 'user'),
+        p.avatar_url,
+        count(*) over ()
+    from auth.users u
+    left join public.profiles p on p.id = u.id
+    where (
+            p_busca is null
+            or u.email ilike '%' || p_busca || '%'
+            or p.full_name ilike '%' || p_busca || '%'
+            or p.username ilike '%' || p_busca || '%'
+          )
+      and (p_perfil is null or coalesce(p.role, 'user') = p_perfil)
+      and (p_confirmado is null or (u.email_confirmed_at is not null) = p_confirmado)
+    order by u.created_at desc
+    limit p_limite
+    offset p_deslocamento;
+$$;
+
+revoke all on function public.listar_usuarios_paginado(text, text, boolean, integer, integer) from public, anon, authenticated;
+grant execute on function public.listar_usuarios_paginado(text, text, boolean, integer, integer) to service_role;
+
+create index if not exists profiles_role_idx on public.profiles (role);
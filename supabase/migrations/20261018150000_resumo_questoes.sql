@@ -0,0 +1,29 @@
+-- Contagens do dashboard agrupadas por matéria e dificuldade, feitas no banco
+-- para que nenhuma linha de questoes precise ser transferida. O resumo é o mesmo
+-- para todos os usuários (o aplicativo o guarda em cache uma única vez); a
+-- contagem das questões de cada usuário é uma consulta à parte, pelo índice de id_user.
+drop function if exists public.resumo_questoes(uuid);
+
+create or replace function public.resumo_questoes()
+returns table (
+    materia text,
+    dificuldade text,
+    total bigint
+)
+language sql
+stable
+set search_path = ''
+as $$
+    select
+        m.materia,
+        q.dificuldade,
+        count(*)
+    from public.questoes q
+    left join public.materias m on m.id = q.id_materia
+    group by m.materia, q.dificuldade;
+$$;
+
+grant execute on function public.resumo_questoes() to anon, authenticated, service_role;
+
+-- Contagem das questões de um usuário (count exact filtrado por id_user)
+create index if not exists questoes_id_user_idx on public.questoes (id_user);
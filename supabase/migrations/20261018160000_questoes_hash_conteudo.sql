@@ -0,0 +1,45 @@
+-- Hash de conteúdo das questões (enunciado, alternativas, gabarito e matéria
+-- normalizados) sob um índice único, para que os salvamentos sejam upserts
+-- idempotentes. A fórmula precisa ser a mesma de hash_conteudo_questao em
+-- services/supabase_client.py.
+alter table public.questoes add column if not exists hash_conteudo text;
+
+create or replace function public.normalizar_texto_questao(p_texto text)
+returns text
+language sql
+immutable
+as $$
+    select lower(regexp_replace(btrim(coalesce(p_texto, ''), E' \t\n\r\f\v'), E'[ \t\n\r\f\v]+', ' ', 'g'));
+$$;
+
+-- Preencher as questões já existentes
+update public.questoes q
+set hash_conteudo = encode(sha256(convert_to(
+    public.normalizar_texto_questao(q.enunciado) || chr(31) ||
+    public.normalizar_texto_questao(q.alternativa1) || chr(31) ||
+    public.normalizar_texto_questao(q.alternativa2) || chr(31) ||
+    public.normalizar_texto_questao(q.alternativa3) || chr(31) ||
+    public.normalizar_texto_questao(q.alternativa4) || chr(31) ||
+    public.normalizar_texto_questao(q.alternativa5) || chr(31) ||
+    public.normalizar_texto_questao(q.gabarito) || chr(31) ||
+    public.normalizar_texto_questao(m.materia) || chr(31) ||
+    public.normalizar_texto_questao(m.tema) || chr(31) ||
+    public.normalizar_texto_questao(m.subtema) || chr(31) ||
+    public.normalizar_texto_questao(m.assunto),
+    'UTF8')), 'hex')
+from public.materias m
+where m.id = q.id_materia
+  and q.hash_conteudo is null;
+
+-- Remover as questões duplicadas, mantendo a mais antiga (menor id)
+delete from public.questoes q
+using (
+    select id, min(id) over (partition by hash_conteudo) as id_mantido
+    from public.questoes
+    where hash_conteudo is not null
+) d
+where q.id = d.id
+  and d.id <> d.id_mantido;
+
+create unique index if not exists questoes_hash_conteudo_key
+    on public.questoes (hash_conteudo);
@@ -0,0 +1,45 @@
+-- Busca, em uma única chamada, questões já salvas para os itens de um arquivo
+-- (matéria, tema, subtema e assunto) na dificuldade pedida, para reaproveitá-las
+-- antes de gerar novas. Cada item informa quantas questões precisa.
+create or replace function public.buscar_questoes_existentes(p_itens jsonb, p_dificuldade text)
+returns table (
+    materia text,
+    tema text,
+    subtema text,
+    assunto text,
+    enunciado text,
+    alternativa1 text,
+    alternativa2 text,
+    alternativa3 text,
+    alternativa4 text,
+    alternativa5 text,
+    gabarito text,
+    resolucao text
+)
+language sql
+stable
+set search_path = ''
+as $$
+    select
+        i.materia, i.tema, i.subtema, i.assunto,
+        q.enunciado::text, q.alternativa1::text, q.alternativa2::text, q.alternativa3::text,
+        q.alternativa4::text, q.alternativa5::text, q.gabarito::text, q.resolucao::text
+    from jsonb_to_recordset(p_itens) as i(materia text, tema text, subtema text, assunto text, quantidade integer)
+    join public.materias m
+        on m.materia = i.materia and m.tema = i.tema and m.subtema = i.subtema and m.assunto = i.assunto
+    cross join lateral (
+        select *
+        from public.questoes q
+        where q.id_materia = m.id
+          and q.dificuldade = p_dificuldade
+        order by q.id
+        limit i.quantidade
+    ) q;
+$$;
+
+grant execute on function public.buscar_questoes_existentes(jsonb, text) to anon, authenticated, service_role;
+
+-- Índice da busca acima: filtra por matéria e dificuldade já na ordem de id,
+-- sem ordenar nem ler questões que não serão devolvidas
+create index if not exists questoes_id_materia_dificuldade_idx
+    on public.questoes (id_materia, dificuldade, id);
@@ -0,0 +1,74 @@
+-- Busca textual nas questões salvas (enunciado, alternativas e resolução) com
+-- stemming em português. A coluna é gerada pelo próprio banco e indexada com
+-- GIN, então a busca não lê as linhas que não casam com a consulta.
+alter table public.questoes
+    add column if not exists busca tsvector generated always as (
+        setweight(to_tsvector('portuguese', coalesce(enunciado, '')), 'A') ||
+        setweight(to_tsvector('portuguese',
+            coalesce(alternativa1, '') || ' ' || coalesce(alternativa2, '') || ' ' ||
+            coalesce(alternativa3, '') || ' ' || coalesce(alternativa4, '') || ' ' ||
+            coalesce(alternativa5, '')), 'B') ||
+        setweight(to_tsvector('portuguese', coalesce(resolucao, '')), 'C')
+    ) stored;
+
+create index if not exists questoes_busca_idx on public.questoes using gin (busca);
+
+-- Busca ordenada por relevância (enunciado pesa mais que alternativas, que pesam
+-- mais que a resolução). Calcular ts_rank_cd para todas as linhas que casam com
+-- um termo comum custaria centenas de milhares de linhas em uma tabela grande,
+-- então só as p_max_candidatos questões mais recentes que casam com a consulta
+-- são ordenadas por relevância. O trecho destacado só é calculado para as linhas
+-- devolvidas, depois do limite.
+drop function if exists public.buscar_questoes(text, integer, integer);
+
+create or replace function public.buscar_questoes(
+    p_consulta text,
+    p_limite integer default 20,
+    p_deslocamento integer default 0,
+    p_max_candidatos integer default 1000
+)
+returns table (
+    id bigint,
+    enunciado text,
+    gabarito text,
+    dificuldade text,
+    materia text,
+    tema text,
+    subtema text,
+    assunto text,
+    relevancia real,
+    trecho text
+)
+language sql
+stable
+set search_path = ''
+as $$
+    with consulta as (
+        select websearch_to_tsquery('portuguese', p_consulta) as q
+    ),
+    candidatas as (
+        select q.id, q.enunciado, q.gabarito, q.dificuldade, q.id_materia, q.busca
+        from public.questoes q, consulta c
+        where q.busca @@ c.q
+        order by q.id desc
+        limit p_max_candidatos
+    ),
+    encontradas as (
+        select k.id, k.enunciado, k.gabarito, k.dificuldade, k.id_materia,
+               ts_rank_cd(k.busca, c.q) as relevancia
+        from candidatas k, consulta c
+        order by relevancia desc, k.id
+        limit p_limite offset p_deslocamento
+    )
+    select
+        e.id::bigint, e.enunciado::text, e.gabarito::text, e.dificuldade::text,
+        m.materia::text, m.tema::text, m.subtema::text, m.assunto::text,
+        e.relevancia,
+        ts_headline('portuguese', e.enunciado, c.q, 'StartSel=**, StopSel=**, MaxFragments=2, MaxWords=30, MinWords=10')
+    from encontradas e
+    cross join consulta c
+    left join public.materias m on m.id = e.id_materia
+    order by e.relevancia desc, e.id;
+$$;
+
+grant execute on function public.buscar_questoes(text, integer, integer, integer) to anon, authenticated, service_role;
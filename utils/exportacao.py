@@ -0,0 +1,137 @@
+import io
+import csv
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+# Exportação das questões em vários formatos. Cada linha é escrita direto no
+# arquivo de saída enquanto a lista de questões é percorrida, sem montar uma
+# lista de linhas ou um DataFrame intermediário.
+
+# Colunas da exportação completa (questões aprovadas)
+COLUNAS_COMPLETAS = [
+    'codigo', 'materia', 'tema', 'subtema', 'assunto', 'dificuldade', 'enunciado',
+    'alternativa1', 'alternativa2', 'alternativa3', 'alternativa4', 'alternativa5',
+    'gabarito', 'resolucao'
+]
+# Colunas da exportação só de metadados (questões não aprovadas)
+COLUNAS_METADADOS = ['codigo', 'materia', 'tema', 'subtema', 'assunto']
+
+# Formatos disponíveis: extensão e tipo MIME
+FORMATOS = {
+    "xlsx": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv": ("csv", "text/csv"),
+    "jsonl": ("jsonl", "application/jsonl"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+# Número de linhas por grupo no Parquet (só um grupo fica em memória por vez)
+LINHAS_POR_GRUPO_PARQUET = 5000
+
+
+def _remover_letra(texto):
+    """Remove a letra do início da alternativa, ex: "A) Alternativa 1" -> "Alternativa 1" """
+    if len(texto) > 3 and texto[0].isalpha() and texto[1:3] == ") ":
+        return texto[3:]
+    return texto
+
+
+def _linhas(questoes, somente_metadados):
+    """Gera uma tupla de valores por questão, na ordem das colunas da exportação"""
+    for questao in questoes:
+        metadados = questao.get('metadados', {})
+        linha = (
+            metadados.get('codigo', ''),
+            metadados.get('materia', ''),
+            metadados.get('tema', ''),
+            metadados.get('subtema', ''),
+            metadados.get('assunto', ''),
+        )
+        if not somente_metadados:
+            linha += (
+                metadados.get('dificuldade', ''),
+                questao.get('enunciado', ''),
+                _remover_letra(questao.get('alternativa1', '')),
+                _remover_letra(questao.get('alternativa2', '')),
+                _remover_letra(questao.get('alternativa3', '')),
+                _remover_letra(questao.get('alternativa4', '')),
+                _remover_letra(questao.get('alternativa5', '')),
+                _remover_letra(questao.get('gabarito', '')),
+                questao.get('resolucao', ''),
+            )
+        yield linha
+
+
+def _escrever_xlsx(saida, colunas, linhas, nome_planilha):
+    # constant_memory grava cada linha em disco assim que a próxima começa
+    workbook = xlsxwriter.Workbook(saida, {'constant_memory': True})
+    planilha = workbook.add_worksheet(nome_planilha)
+    negrito = workbook.add_format({'bold': True})
+    planilha.write_row(0, 0, colunas, negrito)
+    for numero, linha in enumerate(linhas, start=1):
+        planilha.write_row(numero, 0, linha)
+    workbook.close()
+
+
+def _escrever_csv(saida, colunas, linhas):
+    # utf-8-sig para que o Excel reconheça os acentos ao abrir o arquivo
+    texto = io.TextIOWrapper(saida, encoding='utf-8-sig', newline='')
+    escritor = csv.writer(texto)
+    escritor.writerow(colunas)
+    escritor.writerows(linhas)
+    texto.flush()
+    texto.detach()
+
+
+def _escrever_jsonl(saida, colunas, linhas):
+    for linha in linhas:
+        saida.write(json.dumps(dict(zip(colunas, linha)), ensure_ascii=False, default=str).encode('utf-8'))
+        saida.write(b"\n")
+
+
+def _escrever_parquet(saida, colunas, linhas):
+    # Todas as colunas como texto: o código pode ser número em uma linha e texto em outra
+    esquema = pa.schema([(coluna, pa.string()) for coluna in colunas])
+    with pq.ParquetWriter(saida, esquema) as escritor:
+        grupo = []
+        for linha in linhas:
+            grupo.append(linha)
+            if len(grupo) >= LINHAS_POR_GRUPO_PARQUET:
+                escritor.write_table(_tabela_parquet(grupo, colunas, esquema))
+                grupo = []
+        if grupo:
+            escritor.write_table(_tabela_parquet(grupo, colunas, esquema))
+
+
+def _tabela_parquet(grupo, colunas, esquema):
+    """Monta uma tabela do pyarrow com um grupo de linhas"""
+    valores = [[None if valor is None else str(valor) for valor in coluna] for coluna in zip(*grupo)] or [[] for _ in colunas]
+    return pa.Table.from_arrays([pa.array(coluna, type=pa.string()) for coluna in valores], schema=esquema)
+
+
+def exportar_questoes(questoes, formato="xlsx", somente_metadados=False, nome_planilha="Questões"):
+    """
+    Exporta questões no formato escolhido, escrevendo linha a linha.
+    Args:
+        questoes (iterable): Questões no formato JSON
+        formato (str, optional): "xlsx", "csv", "jsonl" ou "parquet"
+        somente_metadados (bool, optional): Se True, exporta apenas código, matéria, tema, subtema e assunto
+        nome_planilha (str, optional): Nome da planilha (apenas para xlsx)
+    Returns:
+        bytes: Conteúdo do arquivo
+    """
+    colunas = COLUNAS_METADADOS if somente_metadados else COLUNAS_COMPLETAS
+    linhas = _linhas(questoes, somente_metadados)
+    saida = io.BytesIO()
+    if formato == "xlsx":
+        _escrever_xlsx(saida, colunas, linhas, nome_planilha)
+    elif formato == "csv":
+        _escrever_csv(saida, colunas, linhas)
+    elif formato == "jsonl":
+        _escrever_jsonl(saida, colunas, linhas)
+    elif formato == "parquet":
+        _escrever_parquet(saida, colunas, linhas)
+    else:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+    return saida.getvalue()
@@ -2,30 +2,89 @@ import streamlit as st
 import time
 import pandas as pd
 import io
-from services.openai_client import gerar_lista_questoes
-from services.supabase_client import salvar_questoes_aprovadas
+import csv
+import codecs
+import json
+import hashlib
+import threading
+import openpyxl
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from cachetools import LRUCache
+from services.openai_client import gerar_lista_questoes, numerar_ocorrencias
+from services import jobs
+from utils.exportacao import exportar_questoes
+from services.supabase_client import buscar_questoes_existentes
 
+# Leitor de XLSX mais rápido (opcional); sem ele, usa o openpyxl
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+
+# Função para registrar que a lista de questões mudou (invalida as exportações em cache)
+def marcar_questoes_alteradas():
+    st.session_state.revisao_questoes = st.session_state.get('revisao_questoes', 0) + 1
 
 # Função para aprovar uma questão
 def aprovar_questao(indice):
     """Marca uma questão como aprovada"""
     if 0 <= indice < len(st.session_state.questoes_geradas):
         st.session_state.questoes_geradas[indice]['aprovado'] = True
+        marcar_questoes_alteradas()
 
 # Função para cancelar aprovação
 def cancelar_aprovacao(indice):
     if 0 <= indice < len(st.session_state.questoes_geradas):
         st.session_state.questoes_geradas[indice]['aprovado'] = False
+        marcar_questoes_alteradas()
 
 # Função para aprovar todas as questões de uma vez
 def aprovar_todas_questoes():
     for i in range(len(st.session_state.questoes_geradas)):
         st.session_state.questoes_geradas[i]['aprovado'] = True
+    marcar_questoes_alteradas()
 
 # Função para contar questões aprovadas
 def contar_questoes_aprovadas():
     return sum(1 for q in st.session_state.questoes_geradas if q.get('aprovado', False))
 
+def exibir_questao(indice, questao):
+    """
+    Exibe uma questão (título, status, enunciado, alternativas, resolução e metadados).
+    Args:
+        indice (int): Índice da questão na lista
+        questao (dict): Questão a ser exibida
+    """
+    # Usar colunas para mostrar título e status de aprovação lado a lado
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.markdown(f"### Questão {indice+1}")
+    with col2:
+        # Mostrar status de aprovação
+        if questao.get('aprovado', False):
+            st.success("✓ Aprovada")
+        else:
+            st.info("Pendente")        
+        if questao.get('reaproveitada', False):
+            st.caption("♻️ Reaproveitada do banco de questões")
+    st.markdown(f"**Questão:** {questao.get('enunciado', 'N/A')}")           
+    # Mostrar alternativas
+    st.markdown(f"{questao.get('alternativa1', 'N/A')}")
+    st.markdown(f"{questao.get('alternativa2', 'N/A')}")
+    st.markdown(f"{questao.get('alternativa3', 'N/A')}")
+    st.markdown(f"{questao.get('alternativa4', 'N/A')}")
+    st.markdown(f"{questao.get('alternativa5', 'N/A')}")
+    # Mostrar resposta correta em destaque
+    st.success(f"**Resposta correta:** {questao.get('gabarito', 'N/A')}")          
+    # Mostrar explicação 
+    st.info(f"**Resolução:** {questao.get('resolucao', 'N/A')}")            
+    # Mostrar metadados
+    st.markdown("**Metadados:**")
+    meta = questao.get('metadados', {})
+    st.markdown(f"**Código:** {meta.get('codigo', 'N/A')} | **Matéria:** {meta.get('materia', 'N/A')} | **Tema:** {meta.get('tema', 'N/A')} | **Subtema:** {meta.get('subtema', 'N/A')} | **Assunto:** {meta.get('assunto', 'N/A')} | **Dificuldade:** {meta.get('dificuldade', 'N/A')}")
+
 def editar_questao(indice, dados_editados):
     """
     Atualiza uma questão com os dados editados.  
@@ -50,6 +109,7 @@ def editar_questao(indice, dados_editados):
         questao['metadados'] = dados_editados['metadados']
     # Salvar a questão atualizada de volta na lista
     st.session_state.questoes_geradas[indice] = questao
+    marcar_questoes_alteradas()
     return True
 
 def regenerar_questao(indice):
@@ -63,22 +123,26 @@ def regenerar_questao(indice):
     # Verificar se o índice é válido
     if indice < 0 or indice >= len(st.session_state.questoes_geradas):
         return False
-    # Obter o item original do JSON dos dados carregados
-    if not st.session_state.json_data or indice >= len(st.session_state.json_data):
+    # Obter o item original do job que gerou as questões
+    itens = st.session_state.get('itens_geracao')
+    if not itens or indice >= len(itens):
         return False   
     # Obter o item correspondente do JSON
-    item = st.session_state.json_data[indice]
+    item = itens[indice]
     # Criar um container para mostrar o progresso
     progress_container = st.empty()
     try:
         # Informar que estamos regenerando
         progress_container.info(f"Regenerando questão {indice+1}...")
-        # Usar o nível de dificuldade atual da sessão
-        questao = gerar_lista_questoes([item], st.session_state.dificuldade)[0]
+        # Usar o nível de dificuldade atual da sessão, ignorando o cache para obter uma questão nova
+        # Informar a ocorrência do item no job, para gravar a nova questão na entrada de cache dessa linha
+        questao = gerar_lista_questoes(
+            [item], st.session_state.dificuldade, forcar_nova=True,
+            ocorrencias=[numerar_ocorrencias(itens)[indice]]
+        )[0]
         # Substituir a questão antiga pela nova
         st.session_state.questoes_geradas[indice] = questao
-        # Pequena pausa para não sobrecarregar a API
-        time.sleep(0.5)
+        marcar_questoes_alteradas()
         # Limpar indicador de progresso
         progress_container.empty()
         return True
@@ -88,174 +152,407 @@ def regenerar_questao(indice):
         progress_container.empty()
         return False
     
-def converter_questoes_para_excel(questoes):
+# Configuração de cada tipo de exportação: só metadados, nome da planilha e filtro das questões
+_EXPORTACOES = {
+    "aprovadas": (False, 'Questões', lambda questao: questao.get('aprovado', False)),
+    "nao_aprovadas": (True, 'Questões não aprovadas', lambda questao: not questao.get('aprovado', False)),
+}
+
+def obter_exportacao(tipo, formato="xlsx"):
     """
-    Converte questões do formato JSON para Excel com as colunas completas.    
+    Retorna o arquivo de exportação já gerado para a versão atual das questões.
     Args:
-        questoes (list): Lista de questões no formato JSON
+        tipo (str): "aprovadas" ou "nao_aprovadas"
+        formato (str, optional): "xlsx", "csv", "jsonl" ou "parquet"
     Returns:
-        bytes: Arquivo Excel em formato bytes
+        bytes: Conteúdo do arquivo, ou None se ainda não foi gerado ou as questões mudaram desde então
     """
-    # Criar listas para armazenar os dados
-    dados = []
-    # Para cada questão, extrair os dados
-    for questao in questoes:
-        # Extrair alternativas (remover a letra do início, ex: "A) Alternativa 1" -> "Alternativa 1")
-        alternativa1 = questao.get('alternativa1', '')
-        if len(alternativa1) > 3 and alternativa1[0].isalpha() and alternativa1[1:3] == ") ":
-            alternativa1 = alternativa1[3:]
-        alternativa2 = questao.get('alternativa2', '')
-        if len(alternativa2) > 3 and alternativa2[0].isalpha() and alternativa2[1:3] == ") ":
-            alternativa2 = alternativa2[3:]
-        alternativa3 = questao.get('alternativa3', '')
-        if len(alternativa3) > 3 and alternativa3[0].isalpha() and alternativa3[1:3] == ") ":
-            alternativa3 = alternativa3[3:]
-        alternativa4 = questao.get('alternativa4', '')
-        if len(alternativa4) > 3 and alternativa4[0].isalpha() and alternativa4[1:3] == ") ":
-            alternativa4 = alternativa4[3:]
-        alternativa5 = questao.get('alternativa5', '')
-        if len(alternativa5) > 3 and alternativa5[0].isalpha() and alternativa5[1:3] == ") ":
-            alternativa5 = alternativa5[3:]
-        gabarito = questao.get('gabarito', '')
-        if len(gabarito) > 3 and gabarito[0].isalpha() and gabarito[1:3] == ") ":
-            gabarito = gabarito[3:]
-        # Obter metadados
-        metadados = questao.get('metadados', {})
-        # Preparar a linha de dados
-        linha = {
-            'codigo': metadados.get('codigo', ''),
-            'materia': metadados.get('materia', ''),
-            'tema': metadados.get('tema', ''),
-            'subtema': metadados.get('subtema', ''),
-            'assunto': metadados.get('assunto', ''),
-            'dificuldade': metadados.get('dificuldade', ''),
-            'enunciado': questao.get('enunciado', ''),
-            'alternativa1': alternativa1,
-            'alternativa2': alternativa2,
-            'alternativa3': alternativa3,
-            'alternativa4': alternativa4,
-            'alternativa5': alternativa5,
-            'gabarito': gabarito,
-            'resolucao': questao.get('resolucao', '')
-        }
-        dados.append(linha)
-    # Criar um DataFrame com os dados
-    df = pd.DataFrame(dados)
-    # Escapes the unicode characters if they exist
-    #df = df.applymap(lambda x: x.encode('unicode_escape').decode('utf-8') if isinstance(x, str) else x)
-    #df = df.apply(lambda col: col.map(lambda x: x.encode('unicode_escape').decode('utf-8') if isinstance(x, str) else x))
-    # Criar um buffer para armazenar o arquivo Excel
-    output = io.BytesIO()
-    # Escrever o DataFrame no arquivo Excel
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Questões')
-    # Obter o conteúdo do Excel como bytes
-    excel_data = output.getvalue()
-    output.close()
-    return excel_data
+    revisao, dados = st.session_state.get('exportacoes', {}).get((tipo, formato), (None, None))
+    return dados if revisao == st.session_state.get('revisao_questoes', 0) else None
 
-def converter_questoes_nao_aprovadas_para_excel(questoes):
+def preparar_exportacao(tipo, formato="xlsx"):
     """
-    Converte questões não aprovadas para Excel com apenas os campos de metadados.
+    Gera o arquivo de exportação e o guarda na sessão até a próxima alteração das questões.
     Args:
-        questoes (list): Lista de questões não aprovadas no formato JSON
+        tipo (str): "aprovadas" ou "nao_aprovadas"
+        formato (str, optional): "xlsx", "csv", "jsonl" ou "parquet"
     Returns:
-        bytes: Arquivo Excel em formato bytes
+        bytes: Conteúdo do arquivo
     """
-    # Criar listas para armazenar os dados
-    dados = []
-    # Para cada questão, extrair apenas os metadados
-    for questao in questoes:
-        # Obter metadados
-        metadados = questao.get('metadados', {})
-        # Preparar a linha de dados
-        linha = {
-            'codigo': metadados.get('codigo', ''),
-            'materia': metadados.get('materia', ''),
-            'tema': metadados.get('tema', ''),
-            'subtema': metadados.get('subtema', ''),
-            'assunto': metadados.get('assunto', '')
+    somente_metadados, nome_planilha, filtro = _EXPORTACOES[tipo]
+    dados = exportar_questoes(
+        (questao for questao in st.session_state.questoes_geradas if filtro(questao)),
+        formato,
+        somente_metadados=somente_metadados,
+        nome_planilha=nome_planilha
+    )
+    # Guardar só a exportação mais recente de cada tipo (em qualquer formato)
+    exportacoes = {
+        chave: valor for chave, valor in st.session_state.get('exportacoes', {}).items() if chave[0] != tipo
+    }
+    exportacoes[(tipo, formato)] = (st.session_state.get('revisao_questoes', 0), dados)
+    st.session_state.exportacoes = exportacoes
+    return dados
+
+def buscar_reaproveitaveis(consultar=True):
+    """
+    Busca no banco questões já salvas para os itens selecionados, na dificuldade
+    selecionada. O resultado fica na sessão, identificado pelo arquivo, pelo número
+    de questões e pela dificuldade, e só é consultado de novo quando um deles muda.
+    Args:
+        consultar (bool, optional): Se False, apenas retorna o resultado já guardado
+            na sessão, sem consultar o banco
+    Returns:
+        list: Para cada item selecionado, a questão existente ou None; None se
+            consultar for False e ainda não houver resultado para a seleção atual
+    """
+    chave = (
+        st.session_state.get('arquivo_processado'),
+        st.session_state.num_questoes,
+        st.session_state.dificuldade
+    )
+    reaproveitaveis = st.session_state.get('reaproveitaveis')
+    if not reaproveitaveis or reaproveitaveis['chave'] != chave:
+        if not consultar:
+            return None
+        json_data_selecionado = st.session_state.json_data[:st.session_state.num_questoes]
+        reaproveitaveis = {
+            "chave": chave,
+            "questoes": buscar_questoes_existentes(json_data_selecionado, st.session_state.dificuldade)
         }
-        
-        dados.append(linha)
-    # Criar um DataFrame com os dados
-    df = pd.DataFrame(dados)
-    # Criar um buffer para armazenar o arquivo Excel
-    output = io.BytesIO()
-    # Escrever o DataFrame no arquivo Excel
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Questões não aprovadas')
-    # Obter o conteúdo do Excel como bytes
-    excel_data = output.getvalue()
-    output.close()    
-    return excel_data
+        st.session_state.reaproveitaveis = reaproveitaveis
+    return reaproveitaveis['questoes']
 
 # Função para gerar questões
-def gerar_questoes():
-    # Marcar que a geração foi realizada
-    st.session_state.geracao_realizada = True   
+def gerar_questoes(modo_lote=False, itens_por_chamada=1, reaproveitar=False):
+    """
+    Inicia, em segundo plano, a geração das questões dos itens selecionados.
+    O job continua rodando mesmo que a página seja recarregada ou o navegador
+    desconecte; use acompanhar_geracao() para exibir o progresso.
+    Args:
+        modo_lote (bool, optional): Se True, usa a Batch API (mais barata, porém pode levar horas)
+        itens_por_chamada (int, optional): Número de itens agrupados em cada chamada à API
+        reaproveitar (bool, optional): Se True, usa as questões já existentes no banco
+            (buscar_reaproveitaveis) e gera apenas as que faltam
+    Returns:
+        str: ID do job de geração
+    """
     # Limitar o número de questões ao selecionado pelo usuário
     json_data_selecionado = st.session_state.json_data[:st.session_state.num_questoes]   
+    existentes = {}
+    if reaproveitar:
+        existentes = {indice: questao for indice, questao in enumerate(buscar_reaproveitaveis()) if questao}
     # Limpar questões anteriores
-    st.session_state.questoes_geradas = []    
-    # Criar um container para mostrar o progresso
-    progress_container = st.empty()
-    progress_bar = st.progress(0)   
-    # Gerar as questões
-    for i, item in enumerate(json_data_selecionado):
-        # Atualizar progresso
-        progresso = (i + 1) / len(json_data_selecionado)
-        progress_bar.progress(progresso)
-        progress_container.text(f"Processando item {i+1} de {len(json_data_selecionado)} - {item.get('materia', 'N/A')} - {item.get('assunto', 'N/A')}  - Dificuldade: {st.session_state.dificuldade}")        
+    st.session_state.questoes_geradas = []
+    marcar_questoes_alteradas()
+    st.session_state.geracao_realizada = False
+    job_id = jobs.submeter_geracao(
+        json_data_selecionado,
+        st.session_state.dificuldade,
+        modo_lote=modo_lote,
+        itens_por_chamada=itens_por_chamada,
+        user_id=st.session_state.get('user_id'),
+        existentes=existentes
+    )
+    st.session_state.job_geracao = job_id
+    return job_id
+
+def carregar_resultado_job(job_id):
+    """
+    Carrega na sessão as questões de um job de geração.
+    Args:
+        job_id (str): ID do job
+    Returns:
+        int: Número de questões geradas sem erro
+    """
+    job = jobs.obter_job(job_id)
+    questoes = jobs.obter_questoes_job(job_id)
+    # Itens sem questão (job interrompido por erro) ficam marcados para regeneração
+    st.session_state.questoes_geradas = [
+        questoes.get(indice) or {
+            "erro": "Questão não gerada",
+            "metadados": {**item, "dificuldade": job["parametros"]["dificuldade"]}
+        }
+        for indice, item in enumerate(job["itens"])
+    ]
+    marcar_questoes_alteradas()
+    # Guardar os itens do job, alinhados às questões, para a regeneração (o arquivo
+    # carregado na página pode ser outro, se o job veio de "Gerações recentes")
+    st.session_state.itens_geracao = job["itens"]
+    st.session_state.geracao_realizada = True
+    return sum(1 for q in st.session_state.questoes_geradas if 'erro' not in q)
+
+# Número de questões mais recentes exibidas enquanto a geração está em andamento
+QUESTOES_EXIBIDAS_ACOMPANHAMENTO = 3
+
+def acompanhar_geracao():
+    """
+    Exibe o progresso do job de geração da sessão e as últimas questões prontas.
+    Quando o job termina, carrega as questões na sessão e recarrega a página.
+    """
+    job_id = st.session_state.get('job_geracao')
+    if not job_id:
+        return
+    # Consulta leve, sem os itens do job: esta função roda a cada poucos segundos
+    job = jobs.obter_job(job_id, com_itens=False)
+    if job is None:
+        st.session_state.job_geracao = None
+        return
+    if job['status'] in ('concluido', 'erro'):
+        num_geradas = carregar_resultado_job(job_id)
+        st.session_state.job_geracao = None
+        st.session_state.resultado_geracao = {"geradas": num_geradas, "erro": job['erro'], "job_id": job_id}
+        st.rerun()
+    total = job['total']
+    concluidas = job['concluidas']
+    dificuldade = job['parametros']['dificuldade']
+    st.progress(concluidas / total if total else 0)
+    if job['parametros'].get('modo_lote'):
+        st.text(f"Lote em processamento na OpenAI: {concluidas} de {total} concluídas - Dificuldade: {dificuldade}")
+        st.caption("Você pode fechar esta página; o lote continua sendo processado e pode ser carregado depois.")
+        return
+    st.text(f"Gerando questões: {concluidas} de {total} concluídas - Dificuldade: {dificuldade}")
+    # Por padrão, exibir só as questões concluídas mais recentemente; a lista
+    # completa (lida a cada atualização) só quando o usuário pedir
+    todas = st.toggle("Mostrar todas as questões concluídas", key=f"toggle_todas_{job_id}")
+    if todas:
+        questoes = jobs.obter_questoes_job(job_id)
+    else:
+        questoes = jobs.obter_questoes_job(job_id, ultimas=QUESTOES_EXIBIDAS_ACOMPANHAMENTO)
+    if questoes:
+        st.subheader("Questões geradas" if todas else "Últimas questões geradas")
+        for indice, questao in questoes.items():
+            exibir_questao(indice, questao)
+            st.markdown("---")
+
+# Colunas lidas dos arquivos enviados
+COLUNAS_ESPERADAS = ['codigo', 'materia', 'tema', 'subtema', 'assunto']
+# Número de registros por bloco na leitura de arquivos
+TAMANHO_BLOCO_LEITURA = 5000
+# Leitores usados para CSV ("pyarrow" ou "pandas") e XLSX ("calamine" ou "openpyxl")
+ENGINE_CSV = st.secrets.get("ARQUIVOS_ENGINE_CSV", "pyarrow")
+ENGINE_XLSX = st.secrets.get("ARQUIVOS_ENGINE_XLSX", "calamine" if CalamineWorkbook else "openpyxl")
+
+# Número de bytes do início do CSV usados para detectar codificação e delimitador
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+
+def detectar_formato_csv(amostra):
+    """
+    Detecta a codificação e o delimitador de um CSV a partir dos seus primeiros bytes.
+    A codificação vem do BOM, se houver; senão é UTF-8 quando a amostra é UTF-8
+    válida e Latin-1 caso contrário. O delimitador é detectado pelo csv.Sniffer
+    entre vírgula, ponto e vírgula, tabulação e barra vertical.
+    Args:
+        amostra (bytes): Início do arquivo
+    Returns:
+        tuple: (codificação, delimitador)
+    """
+    if amostra.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    elif amostra.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    else:
         try:
-            questao = gerar_lista_questoes([item], st.session_state.dificuldade)[0]
-            st.session_state.questoes_geradas.append(questao)
-            # Pequena pausa para não sobrecarregar a API
-            time.sleep(0.5)
-        except Exception as e:
-            st.error(f"Erro ao gerar questão para o item {i+1}: {str(e)}")   
-    # Limpar indicadores de progresso
-    progress_container.empty()
-    progress_bar.empty()            
-    # Retornar o número de questões geradas
-    return len(st.session_state.questoes_geradas)
+            # final=False: a amostra pode terminar no meio de um caractere
+            codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'latin1'
+    texto = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(amostra, final=False)
+    # Usar só as linhas completas da amostra
+    if len(amostra) >= TAMANHO_AMOSTRA_CSV and '\n' in texto:
+        texto = texto[:texto.rindex('\n')]
+    try:
+        delimitador = csv.Sniffer().sniff(texto, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimitador = ','
+    return encoding, delimitador
+
+# Leituras de arquivos, em andamento ou concluídas, pelo nome e hash do conteúdo
+# (os arquivos lidos mais recentemente ficam guardados, para não lê-los de novo)
+_leituras = LRUCache(maxsize=int(st.secrets.get("CACHE_ARQUIVOS_MAX_ENTRADAS", 8)))
+_lock_leituras = threading.Lock()
 
-def process_file(file):
+def iniciar_leitura(file):
+    """
+    Começa a ler o arquivo enviado e retorna assim que o primeiro bloco de
+    registros estiver pronto; o restante é lido em segundo plano, acrescentado
+    à mesma lista. Assim a geração pode começar antes de o arquivo inteiro ser lido.
+    Args:
+        file (UploadedFile): Arquivo .xlsx ou .csv enviado
+    Returns:
+        dict: 'registros' (list, que cresce até o fim da leitura), 'concluida' (bool)
+            e 'erro' (str ou None, erro no restante do arquivo); None se o
+            arquivo não puder ser lido
+    """
+    conteudo = file.getvalue()
+    chave = (file.name, hashlib.sha256(conteudo).hexdigest())
+    with _lock_leituras:
+        leitura = _leituras.get(chave)
+    if leitura is not None:
+        return leitura
     try:
-        # Detect file type and read accordingly
-        if file.name.endswith('.xlsx'):
-            df = pd.read_excel(file)
-        elif file.name.endswith('.csv'):
-            # Try to read with different encodings and delimiters
-            try:
-                df = pd.read_csv(file, encoding='utf-8')
-            except UnicodeDecodeError:
-                try:
-                    df = pd.read_csv(file, encoding='latin1')
-                except:
-                    df = pd.read_csv(file, encoding='ISO-8859-1')           
-            # If semicolon is the delimiter, parse again
-            if len(df.columns) == 1 and df.columns[0].count(';') > 0:
-                file.seek(0)  # Go back to the beginning of the file
-                df = pd.read_csv(file, sep=';')
-        else:
-            st.error("Formato de arquivo não suportado.")
-            return None
-        # Expected column names
-        expected_columns = ['codigo', 'materia', 'tema', 'subtema', 'assunto']
-        # Check if file has the required columns or if we need to rename columns
-        if not all(col in df.columns for col in expected_columns):
-            # If the file has the right number of columns but wrong names
-            if len(df.columns) >= len(expected_columns):
-                # Rename the first 5 columns to the expected names
-                column_mapping = {df.columns[i]: expected_columns[i] for i in range(min(len(df.columns), len(expected_columns)))}
-                df = df.rename(columns=column_mapping)
-            else:
-                st.error(f"O arquivo não contém todas as colunas necessárias. Colunas esperadas: {', '.join(expected_columns)}")
-                return None                
-        # Convert DataFrame to list of dictionaries (JSON-like format)
-        result = df.to_dict(orient='records')
-        return result
+        # Ler em blocos: só um bloco por vez fica em formato intermediário
+        blocos = ler_registros_em_blocos(file.name, conteudo)
+        leitura = {"registros": list(next(blocos, [])), "concluida": False, "erro": None}
+    except ValueError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Erro ao processar o arquivo: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+    def ler_restante():
+        try:
+            for bloco in blocos:
+                leitura["registros"].extend(bloco)
+        except Exception as e:
+            print(f"Erro ao ler o arquivo {file.name}: {str(e)}")
+            leitura["erro"] = str(e)
+            # Não guardar uma leitura incompleta
+            with _lock_leituras:
+                _leituras.pop(chave, None)
+        leitura["concluida"] = True
+
+    with _lock_leituras:
+        _leituras[chave] = leitura
+    threading.Thread(target=ler_restante, name="leitura-arquivo", daemon=True).start()
+    return leitura
+
+def _mapear_colunas(colunas):
+    """
+    Escolhe as colunas a ler: as colunas esperadas, se o arquivo tiver todas;
+    senão, as 5 primeiras, renomeadas para os nomes esperados.
+    Args:
+        colunas (list): Nomes das colunas do arquivo (cabeçalho)
+    Returns:
+        list: Posição no arquivo de cada coluna esperada, na ordem de COLUNAS_ESPERADAS
+    """
+    colunas = [str(coluna).strip() for coluna in colunas]
+    if all(coluna in colunas for coluna in COLUNAS_ESPERADAS):
+        return [colunas.index(coluna) for coluna in COLUNAS_ESPERADAS]
+    if len(colunas) >= len(COLUNAS_ESPERADAS):
+        return list(range(len(COLUNAS_ESPERADAS)))
+    raise ValueError(f"O arquivo não contém todas as colunas necessárias. Colunas esperadas: {', '.join(COLUNAS_ESPERADAS)}")
+
+def _normalizar_celula(valor):
+    """Converte células vazias em "" e números inteiros lidos como float (ex.: 12.0) em int"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def _ler_blocos_csv(conteudo, tamanho_bloco):
+    """
+    Lê um CSV em blocos de registros, com a codificação e o delimitador detectados.
+    A codificação é detectada só na amostra do início do arquivo; se um byte
+    inválido em UTF-8 aparecer mais adiante, a leitura recomeça em Latin-1,
+    pulando os registros já entregues.
+    """
+    encoding, delimitador = detectar_formato_csv(conteudo[:TAMANHO_AMOSTRA_CSV])
+    entregues = 0
+    try:
+        for bloco in _ler_blocos_csv_codificado(conteudo, encoding, delimitador, tamanho_bloco):
+            entregues += len(bloco)
+            yield bloco
+    except (UnicodeDecodeError, pa.ArrowInvalid) as e:
+        # ArrowInvalid também cobre outros erros de leitura; só recomeçar nos de UTF-8
+        if encoding != 'utf-8' or not (isinstance(e, UnicodeDecodeError) or 'UTF8' in str(e)):
+            raise
+        print(f"CSV com bytes inválidos em UTF-8 após a amostra, lendo de novo em Latin-1: {str(e)}")
+        pular = entregues
+        for bloco in _ler_blocos_csv_codificado(conteudo, 'latin1', delimitador, tamanho_bloco):
+            if pular >= len(bloco):
+                pular -= len(bloco)
+                continue
+            yield bloco[pular:]
+            pular = 0
+
+def _ler_blocos_csv_codificado(conteudo, encoding, delimitador, tamanho_bloco):
+    """Lê um CSV em blocos de registros com a codificação e o delimitador informados"""
+    # O cabeçalho vem da amostra, para ler só as colunas necessárias
+    amostra = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(conteudo[:TAMANHO_AMOSTRA_CSV], final=False)
+    cabecalho = next(csv.reader(io.StringIO(amostra), delimiter=delimitador), [])
+    posicoes = _mapear_colunas(cabecalho)
+    # As colunas são escolhidas pela posição: cabeçalhos vazios ou repetidos não
+    # servem como nome de coluna em nenhum dos leitores
+    if ENGINE_CSV == 'pyarrow':
+        nomes = [f"coluna_{posicao}" for posicao in range(len(cabecalho))]
+        colunas = [nomes[posicao] for posicao in posicoes]
+        leitor = pa_csv.open_csv(
+            io.BytesIO(conteudo),
+            # O pyarrow já ignora o BOM do UTF-8 e converte as demais codificações;
+            # o cabeçalho do arquivo é pulado e as colunas recebem nomes próprios
+            read_options=pa_csv.ReadOptions(
+                encoding='utf8' if encoding == 'utf-8-sig' else encoding,
+                column_names=nomes,
+                skip_rows=1
+            ),
+            parse_options=pa_csv.ParseOptions(delimiter=delimitador),
+            # Ler tudo como texto: a inferência de tipos por bloco falharia em colunas mistas
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=colunas,
+                column_types={coluna: pa.string() for coluna in colunas}
+            )
+        )
+        for lote in leitor:
+            registros = lote.rename_columns(COLUNAS_ESPERADAS).to_pylist()
+            for inicio in range(0, len(registros), tamanho_bloco):
+                yield registros[inicio:inicio + tamanho_bloco]
+    else:
+        blocos = pd.read_csv(
+            io.BytesIO(conteudo), encoding=encoding, sep=delimitador, header=None, skiprows=1,
+            usecols=posicoes, dtype=str, keep_default_na=False, chunksize=tamanho_bloco
+        )
+        for df in blocos:
+            # Sem cabeçalho, as colunas se chamam pela posição no arquivo; usecols
+            # não mantém a ordem pedida, então reordenar por elas
+            df = df[posicoes]
+            df.columns = COLUNAS_ESPERADAS
+            yield df.to_dict(orient='records')
+
+def _ler_blocos_xlsx(conteudo, tamanho_bloco):
+    """Lê a primeira planilha de um XLSX em blocos de registros, linha a linha"""
+    if ENGINE_XLSX == 'calamine':
+        linhas = CalamineWorkbook.from_filelike(io.BytesIO(conteudo)).get_sheet_by_index(0).iter_rows()
+    else:
+        planilha = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True).worksheets[0]
+        linhas = planilha.iter_rows(values_only=True)
+    posicoes = _mapear_colunas(next(linhas, []))
+    bloco = []
+    for linha in linhas:
+        # Ignorar linhas totalmente vazias (comum no fim de planilhas)
+        if not any(valor not in (None, '') for valor in linha):
+            continue
+        bloco.append({
+            coluna: _normalizar_celula(linha[posicao]) if posicao < len(linha) else ''
+            for coluna, posicao in zip(COLUNAS_ESPERADAS, posicoes)
+        })
+        if len(bloco) >= tamanho_bloco:
+            yield bloco
+            bloco = []
+    if bloco:
+        yield bloco
+
+def ler_registros_em_blocos(nome, conteudo, tamanho_bloco=TAMANHO_BLOCO_LEITURA):
+    """
+    Lê um arquivo .xlsx ou .csv e gera seus registros aos poucos, em listas de
+    até tamanho_bloco dicionários com as colunas de COLUNAS_ESPERADAS. Só essas
+    colunas são lidas, e a memória usada não cresce com o tamanho do arquivo
+    além dos blocos já consumidos.
+    Args:
+        nome (str): Nome do arquivo (a extensão define o formato)
+        conteudo (bytes): Conteúdo do arquivo
+        tamanho_bloco (int, optional): Número máximo de registros por bloco
+    Yields:
+        list: Bloco de registros
+    Raises:
+        ValueError: Se o formato não for suportado ou faltarem colunas
+    """
+    if nome.endswith('.xlsx'):
+        yield from _ler_blocos_xlsx(conteudo, tamanho_bloco)
+    elif nome.endswith('.csv'):
+        yield from _ler_blocos_csv(conteudo, tamanho_bloco)
+    else:
+        raise ValueError("Formato de arquivo não suportado.")
\ No newline at end of file
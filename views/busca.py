@@ -0,0 +1,59 @@
+import streamlit as st
+from services.supabase_client import buscar_questoes_banco
+
+st.title("Buscar Questões")
+st.write("Pesquise no banco de questões salvas pelo enunciado, alternativas ou resolução.")
+
+RESULTADOS_POR_PAGINA = 20
+
+consulta = st.text_input(
+    "Buscar",
+    key="busca_consulta",
+    placeholder='Ex.: fotossíntese, "revolução industrial", mitose -meiose',
+    help='Palavras são buscadas pelo radical (ex.: "célula" encontra "células"). Use aspas para frases exatas, OR para alternativas e - para excluir termos.'
+)
+
+# Voltar para a primeira página quando a consulta mudar
+if st.session_state.get('busca_ultima_consulta') != consulta:
+    st.session_state.busca_ultima_consulta = consulta
+    st.session_state.busca_pagina = 1
+pagina = st.session_state.get('busca_pagina', 1)
+
+if consulta.strip():
+    try:
+        resultados = buscar_questoes_banco(
+            consulta,
+            limite=RESULTADOS_POR_PAGINA,
+            deslocamento=(pagina - 1) * RESULTADOS_POR_PAGINA
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar questões: {str(e)}")
+        resultados = []
+
+    if resultados:
+        for resultado in resultados:
+            with st.container(border=True):
+                st.markdown(resultado.get('trecho') or resultado.get('enunciado', ''))
+                st.caption(
+                    f"**Matéria:** {resultado.get('materia') or 'N/A'} | **Tema:** {resultado.get('tema') or 'N/A'} | "
+                    f"**Subtema:** {resultado.get('subtema') or 'N/A'} | **Assunto:** {resultado.get('assunto') or 'N/A'} | "
+                    f"**Dificuldade:** {resultado.get('dificuldade') or 'N/A'}"
+                )
+                with st.expander("Enunciado completo"):
+                    st.write(resultado.get('enunciado', ''))
+                    st.success(f"**Resposta correta:** {resultado.get('gabarito', 'N/A')}")
+    elif pagina == 1:
+        st.info("Nenhuma questão encontrada.")
+
+    # Navegação entre páginas
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("← Anterior", key="btn_busca_anterior", disabled=pagina <= 1):
+            st.session_state.busca_pagina = pagina - 1
+            st.rerun()
+    with nav_col2:
+        st.write(f"Página {pagina}")
+    with nav_col3:
+        if st.button("Próxima →", key="btn_busca_proxima", disabled=len(resultados) < RESULTADOS_POR_PAGINA):
+            st.session_state.busca_pagina = pagina + 1
+            st.rerun()
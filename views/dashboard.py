@@ -1,21 +1,43 @@
 import streamlit as st
+from services.supabase_client import obter_estatisticas_questoes
+from services.jobs import contar_questoes_geradas
 
 st.title("Dashboard")
 st.write("Bem-vindo ao Dashboard do Gerador de Questões!")
 st.write("Utilize a barra lateral para navegar entre as funcionalidades da aplicação.")
 
-# Estatísticas (placeholder para futura implementação)
+# Estatísticas (contadas no banco e mantidas em cache por alguns minutos)
 st.subheader("Estatísticas")
 
+user_id = st.session_state.get('user_id')
+try:
+    estatisticas = obter_estatisticas_questoes(user_id)
+except Exception as e:
+    st.error(f"Erro ao carregar as estatísticas: {str(e)}")
+    estatisticas = None
+
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.metric("Questões Geradas", "--")
+    st.metric("Questões Geradas (este servidor)", contar_questoes_geradas(user_id),
+              help="Questões geradas com sucesso pelos seus jobs neste servidor, sem contar as reaproveitadas do banco. "
+                   "O histórico de jobs é local e recomeça quando o aplicativo é reimplantado.")
 
 with col2:
-    st.metric("Questões Aprovadas", "--")
+    st.metric("Questões Aprovadas", estatisticas["do_usuario"] if estatisticas else "--",
+              help="Questões aprovadas e salvas no banco por você")
 
 with col3:
-    st.metric("Questões no Banco", "--")
-    
-st.info("Esta é a página inicial do aplicativo. Use a funcionalidade 'Gerar Questões' para começar a criar questões de múltipla escolha.")
\ No newline at end of file
+    st.metric("Questões no Banco", estatisticas["total"] if estatisticas else "--",
+              help="Total de questões no banco, de todos os usuários")
+
+if estatisticas and estatisticas["por_materia"]:
+    graf_col1, graf_col2 = st.columns(2)
+    with graf_col1:
+        st.caption("Questões por matéria")
+        st.bar_chart(estatisticas["por_materia"])
+    with graf_col2:
+        st.caption("Questões por dificuldade")
+        st.bar_chart(estatisticas["por_dificuldade"])
+
+st.info("Esta é a página inicial do aplicativo. Use a funcionalidade 'Gerar Questões' para começar a criar questões de múltipla escolha.")
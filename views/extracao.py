@@ -1,6 +1,11 @@
 import streamlit as st
 import utils.question_utils as qu
-from services.supabase_client import salvar_questoes_aprovadas
+from utils.exportacao import FORMATOS
+from services.fila_salvamento import enfileirar_questoes, estado_fila, reenviar_falhas, descartar_falhas
+from services.openai_client import cache as cache_questoes, uso_cache_prompt
+from services.jobs import listar_jobs_usuario
+from services.metricas import resumo_lote
+from datetime import datetime
 
 st.title('Geração de Questões')
 st.write("Faça o upload de um arquivo Excel (.xlsx) ou CSV (.csv)")
@@ -9,22 +14,41 @@ st.write("Faça o upload de um arquivo Excel (.xlsx) ou CSV (.csv)")
 if 'num_questoes' not in st.session_state:
     st.session_state.num_questoes = 3
 
+# Acompanhar a leitura em segundo plano do arquivo, recarregando a página quando terminar
+@st.fragment(run_every=1)
+def acompanhar_leitura(leitura):
+    if leitura['concluida']:
+        st.rerun()
+    st.info(f"Lendo o arquivo... {len(leitura['registros'])} registros carregados até agora. Você já pode gerar questões para eles.")
+
 # File upload component
 uploaded_file = st.file_uploader("Escolha um arquivo", type=["xlsx", "csv"])
     
 # Display content based on uploaded file
 if uploaded_file is not None:
     st.write("Arquivo carregado com sucesso!") 
-    # Add button to process file
-    with st.spinner("Processando Arquivo..."):
-        json_data = qu.process_file(uploaded_file)
-        # Salvar os dados no estado da sessão
-        st.session_state.json_data = json_data
+    # Processar o arquivo só quando ele mudar (não a cada interação com a página)
+    if st.session_state.get('arquivo_processado') != uploaded_file.file_id:
+        with st.spinner("Processando Arquivo..."):
+            # Só o primeiro bloco é lido aqui; o restante do arquivo é lido em
+            # segundo plano e acrescentado à mesma lista de registros
+            leitura = qu.iniciar_leitura(uploaded_file)
+            # Salvar os dados no estado da sessão
+            st.session_state.leitura_arquivo = leitura
+            st.session_state.json_data = leitura['registros'] if leitura else None
+            st.session_state.arquivo_processado = uploaded_file.file_id
+    json_data = st.session_state.json_data
+    leitura = st.session_state.get('leitura_arquivo')
     if json_data:
-        # Determinar o número máximo de questões com base no número de registros no arquivo
+        # Determinar o número máximo de questões com base no número de registros já lidos
         max_registros = len(json_data)
         valor_padrao = min(3, max_registros)  # Valor padrão é 3 ou o número máximo de registros, o que for menor      
-        st.success(f"Arquivo analisado com sucesso! {max_registros} registros encontrados.")       
+        if leitura and not leitura['concluida']:
+            acompanhar_leitura(leitura)
+        elif leitura and leitura['erro']:
+            st.warning(f"Erro ao ler o restante do arquivo: {leitura['erro']}. Apenas {max_registros} registros foram carregados.")
+        else:
+            st.success(f"Arquivo analisado com sucesso! {max_registros} registros encontrados.")       
         # Adiciona um controle deslizante para selecionar o número de questões
         # e salva o valor no estado da sessão
         st.session_state.num_questoes = st.slider(
@@ -44,13 +68,89 @@ if uploaded_file is not None:
             horizontal=True,  # Mostra os botões horizontalmente
             label_visibility="collapsed"  # Oculta o rótulo principal pois já temos um título acima
         )
+        # Modo em lote para planilhas muito grandes
+        modo_lote = st.checkbox(
+            "Gerar em lote (Batch API)",
+            value=False,
+            help="Mais barato por questão e indicado para milhares de registros, mas o resultado pode levar horas."
+        )
+        # Número de itens agrupados em cada chamada à API
+        itens_por_chamada = st.select_slider(
+            "Itens por chamada à API",
+            options=[1, 2, 3, 5, 10],
+            value=1,
+            disabled=modo_lote,
+            help="Agrupar vários itens em uma única chamada reduz o custo e o número de requisições."
+        )
+        # Reaproveitar questões já salvas no banco para os mesmos itens e dificuldade
+        # (a consulta ao banco só é feita quando o usuário pede)
+        reaproveitar = False
+        existentes = qu.buscar_reaproveitaveis(consultar=False)
+        if existentes is None:
+            if st.button("Verificar questões existentes no banco", key="btn_verificar_existentes"):
+                with st.spinner("Buscando questões existentes..."):
+                    existentes = qu.buscar_reaproveitaveis()
+        num_existentes = sum(1 for questao in existentes or [] if questao)
+        if existentes is not None and num_existentes == 0:
+            st.caption("Nenhuma questão existente no banco para estes itens e dificuldade.")
+        if num_existentes > 0:
+            reaproveitar = st.checkbox(
+                f"Reaproveitar {num_existentes} questões já existentes no banco e gerar apenas {st.session_state.num_questoes - num_existentes} novas",
+                value=True,
+                help="Usa questões já aprovadas com a mesma matéria, tema, subtema, assunto e dificuldade, sem custo de geração."
+            )
         # Botão para gerar questões
-        if st.button("Gerar Questões", key="btn_gerar_questoes"):
-            # Chamar a função para gerar questões (não precisa de spinner, já tem barra de progresso)
-            num_geradas = qu.gerar_questoes()
-            if num_geradas > 0:
-                st.success(f"{num_geradas} questões geradas com sucesso!")
-            st.session_state.geracao_realizada = True
+        if st.button("Gerar Questões", key="btn_gerar_questoes", disabled=bool(st.session_state.get('job_geracao'))):
+            # Iniciar a geração em segundo plano (o progresso é acompanhado abaixo)
+            qu.gerar_questoes(modo_lote=modo_lote, itens_por_chamada=itens_por_chamada, reaproveitar=reaproveitar)
+
+# Acompanhar a geração em segundo plano, atualizando só este trecho da página
+@st.fragment(run_every=2)
+def acompanhar_geracao():
+    qu.acompanhar_geracao()
+
+if st.session_state.get('job_geracao'):
+    acompanhar_geracao()
+
+# Mostrar o resultado da última geração concluída
+if st.session_state.get('resultado_geracao'):
+    resultado_geracao = st.session_state.pop('resultado_geracao')
+    if resultado_geracao['erro']:
+        st.error(f"Erro ao gerar questões: {resultado_geracao['erro']}")
+    if resultado_geracao['geradas'] > 0:
+        st.success(f"{resultado_geracao['geradas']} questões geradas com sucesso!")
+    # Mostrar as métricas das chamadas à API desta geração
+    resumo = resumo_lote(resultado_geracao['job_id'])
+    if resumo:
+        met_col1, met_col2, met_col3, met_col4 = st.columns(4)
+        met_col1.metric("Latência p50", f"{resumo['latencia_p50']:.1f} s" if resumo['latencia_p50'] is not None else "--")
+        met_col2.metric("Latência p95", f"{resumo['latencia_p95']:.1f} s" if resumo['latencia_p95'] is not None else "--")
+        met_col3.metric("Tokens por questão", f"{resumo['tokens_por_questao']:.0f}" if resumo['tokens_por_questao'] else "--")
+        met_col4.metric("Questões por minuto", f"{resumo['questoes_por_minuto']:.1f}" if resumo['questoes_por_minuto'] else "--")
+        st.caption(f"{resumo['chamadas']} chamadas à API, {resumo['tentativas'] - resumo['chamadas']} novas tentativas, {resumo['erros']} com erro.")
+    # Mostrar o aproveitamento do cache de questões
+    if cache_questoes:
+        estatisticas = cache_questoes.estatisticas()
+        st.caption(f"Cache de questões: {estatisticas['acertos']} acertos, {estatisticas['falhas']} falhas, {estatisticas['entradas']} questões armazenadas.")
+    # Mostrar o aproveitamento do cache de prefixo do prompt na OpenAI
+    uso = uso_cache_prompt()
+    if uso['chamadas']:
+        st.caption(f"Cache de prompt da OpenAI: {uso['tokens_cacheados']} de {uso['tokens_entrada']} tokens de entrada reaproveitados ({uso['taxa_acerto']:.0%}) em {uso['chamadas']} chamadas.")
+
+# Permitir retomar gerações iniciadas em outra sessão (ex.: após fechar o navegador)
+if not st.session_state.get('job_geracao') and not st.session_state.questoes_geradas:
+    jobs_recentes = listar_jobs_usuario(st.session_state.get('user_id'))
+    if jobs_recentes:
+        with st.expander("Gerações recentes"):
+            for job in jobs_recentes:
+                job_col1, job_col2 = st.columns([3, 1])
+                with job_col1:
+                    criado_em = datetime.fromtimestamp(job['criado_em']).strftime("%d/%m/%Y %H:%M")
+                    st.write(f"{criado_em} - {job['concluidas']} de {job['total']} questões - {job['status']}")
+                with job_col2:
+                    if st.button("Carregar", key=f"btn_carregar_job_{job['id']}"):
+                        st.session_state.job_geracao = job['id']
+                        st.rerun()
 
 # Mostrar questões só se já foram geradas
 if st.session_state.get('geracao_realizada', False) and st.session_state.questoes_geradas:
@@ -63,31 +163,8 @@ if st.session_state.get('geracao_realizada', False) and st.session_state.questoe
         # Container para toda a questão
         question_container = st.container()     
         with question_container:
-            # Usar colunas para mostrar título e status de aprovação lado a lado
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.markdown(f"### Questão {i+1}")
-            with col2:
-                # Mostrar status de aprovação
-                if questao.get('aprovado', False):
-                    st.success("✓ Aprovada")
-                else:
-                    st.info("Pendente")        
-            st.markdown(f"**Questão:** {questao.get('enunciado', 'N/A')}")           
-            # Mostrar alternativas
-            st.markdown(f"{questao.get('alternativa1', 'N/A')}")
-            st.markdown(f"{questao.get('alternativa2', 'N/A')}")
-            st.markdown(f"{questao.get('alternativa3', 'N/A')}")
-            st.markdown(f"{questao.get('alternativa4', 'N/A')}")
-            st.markdown(f"{questao.get('alternativa5', 'N/A')}")
-            # Mostrar resposta correta em destaque
-            st.success(f"**Resposta correta:** {questao.get('gabarito', 'N/A')}")          
-            # Mostrar explicação 
-            st.info(f"**Resolução:** {questao.get('resolucao', 'N/A')}")            
-            # Mostrar metadados
-            st.markdown("**Metadados:**")
-            meta = questao.get('metadados', {})
-            st.markdown(f"**Código:** {meta.get('codigo', 'N/A')} | **Matéria:** {meta.get('materia', 'N/A')} | **Tema:** {meta.get('tema', 'N/A')} | **Subtema:** {meta.get('subtema', 'N/A')} | **Assunto:** {meta.get('assunto', 'N/A')} | **Dificuldade:** {meta.get('dificuldade', 'N/A')}")
+            # Mostrar a questão (enunciado, alternativas, resolução e metadados)
+            qu.exibir_questao(i, questao)
             
             # Estado de edição para esta questão
             if f"edit_mode_{i}" not in st.session_state:
@@ -243,21 +320,24 @@ if st.session_state.get('geracao_realizada', False) and st.session_state.questoe
             if st.button("💾 Salvar questões aprovadas no banco de dados", use_container_width=True):
                 # Filtrar apenas questões aprovadas
                 questoes_aprovadas_lista = [q for q in st.session_state.questoes_geradas if q.get('aprovado', False)]      
-                # Tentar salvar no Supabase
-                with st.spinner("Salvando questões no banco de dados..."):
-                    try:
-                        # Obter o ID do usuário atual da sessão
-                        user_id = st.session_state.get('user_id')
-                        # Chamar a função para salvar questões aprovadas
-                        questoes_salvas, total = salvar_questoes_aprovadas(questoes_aprovadas_lista, user_id)       
-                        if questoes_salvas > 0:
-                            st.success(f"{questoes_salvas} de {total} questões foram salvas no banco de dados com sucesso!")
-                        else:
-                            st.error("Não foi possível salvar nenhuma questão no banco de dados.")   
-                    except Exception as e:
-                        st.error(f"Erro ao salvar no banco de dados: {str(e)}")
+                # Gravar na fila local; o envio ao Supabase é feito em segundo plano
+                try:
+                    # Obter o ID do usuário atual da sessão
+                    user_id = st.session_state.get('user_id')
+                    enfileiradas = enfileirar_questoes(questoes_aprovadas_lista, user_id)
+                    st.success(f"{enfileiradas} questões foram enviadas para salvamento no banco de dados!")
+                except Exception as e:
+                    st.error(f"Erro ao salvar as questões: {str(e)}")
         else:
             st.warning("Aprove pelo menos uma questão para poder salvar no banco de dados.")
+        # Formato dos arquivos para download
+        formato = st.selectbox(
+            "Formato do arquivo para download",
+            options=list(FORMATOS),
+            format_func=lambda f: {"xlsx": "Excel (.xlsx)", "csv": "CSV (.csv)", "jsonl": "JSON Lines (.jsonl)", "parquet": "Parquet (.parquet)"}[f],
+            key="formato_exportacao"
+        )
+        extensao, mime = FORMATOS[formato]
         # Botões para download em três colunas
         dl_col1, dl_col2, dl_col3 = st.columns(3)
         # Botão para aprovar todas as questões
@@ -275,31 +355,56 @@ if st.session_state.get('geracao_realizada', False) and st.session_state.questoe
                 else:
                     st.success("Todas as questões já estão aprovadas!")
             with dlb_col2:
-                # Filtrar apenas questões aprovadas
-                questoes_aprovadas_lista = [q for q in st.session_state.questoes_geradas if q.get('aprovado', False)]         
-                if questoes_aprovadas_lista:
-                    # Gerar dados em Excel apenas para questões aprovadas
-                    excel_aprovadas = qu.converter_questoes_para_excel(questoes_aprovadas_lista)
-                    st.download_button(
-                        label="Baixar apenas aprovadas (Excel)",
-                        data=excel_aprovadas,
-                        file_name="questoes_aprovadas.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+                if questoes_aprovadas > 0:
+                    # Gerar o arquivo só quando pedido; fica em cache até as questões mudarem
+                    arquivo_aprovadas = qu.obter_exportacao("aprovadas", formato)
+                    if arquivo_aprovadas is None and st.button("Preparar arquivo das aprovadas", key="btn_exportar_aprovadas"):
+                        with st.spinner("Gerando arquivo..."):
+                            arquivo_aprovadas = qu.preparar_exportacao("aprovadas", formato)
+                    if arquivo_aprovadas is not None:
+                        st.download_button(
+                            label=f"Baixar apenas aprovadas (.{extensao})",
+                            data=arquivo_aprovadas,
+                            file_name=f"questoes_aprovadas.{extensao}",
+                            mime=mime
+                        )
                 else:
                     st.write("Nenhuma questão aprovada ainda")
             with dlb_col3:
-                # Filtrar apenas questões NÃO aprovadas
-                questoes_nao_aprovadas_lista = [q for q in st.session_state.questoes_geradas if not q.get('aprovado', False)]      
-                if questoes_nao_aprovadas_lista:
-                    # Gerar dados em Excel apenas para metadados das questões NÃO aprovadas
-                    excel_nao_aprovadas = qu.converter_questoes_nao_aprovadas_para_excel(questoes_nao_aprovadas_lista)
-                    st.download_button(
-                        label="Baixar apenas não aprovadas (Excel)",
-                        data=excel_nao_aprovadas,
-                        file_name="questoes_nao_aprovadas.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+                if questoes_nao_aprovadas > 0:
+                    # Gerar o arquivo (só metadados) só quando pedido; fica em cache até as questões mudarem
+                    arquivo_nao_aprovadas = qu.obter_exportacao("nao_aprovadas", formato)
+                    if arquivo_nao_aprovadas is None and st.button("Preparar arquivo das não aprovadas", key="btn_exportar_nao_aprovadas"):
+                        with st.spinner("Gerando arquivo..."):
+                            arquivo_nao_aprovadas = qu.preparar_exportacao("nao_aprovadas", formato)
+                    if arquivo_nao_aprovadas is not None:
+                        st.download_button(
+                            label=f"Baixar apenas não aprovadas (.{extensao})",
+                            data=arquivo_nao_aprovadas,
+                            file_name=f"questoes_nao_aprovadas.{extensao}",
+                            mime=mime
+                        )
                 else:
                     st.write("Todas as questões já foram aprovadas")  
-        
\ No newline at end of file
+        
+
+# Mostrar as questões do usuário que ainda não chegaram ao banco, mesmo sem questões
+# geradas nesta sessão (ex.: salvamentos de uma sessão anterior que falharam)
+fila = estado_fila(st.session_state.get('user_id'))
+if fila['pendentes']:
+    if fila['ultimo_erro']:
+        st.warning(f"{fila['pendentes']} questões aguardando envio ao banco de dados (serão reenviadas automaticamente). Último erro: {fila['ultimo_erro']}")
+    else:
+        st.caption(f"{fila['pendentes']} questões sendo enviadas ao banco de dados...")
+# Questões que esgotaram as tentativas de envio
+if fila['falhas']:
+    st.error(f"{fila['falhas']} questões não puderam ser salvas no banco de dados. Último erro: {fila['erro_falhas']}")
+    falha_col1, falha_col2 = st.columns(2)
+    with falha_col1:
+        if st.button("Tentar salvar novamente", key="btn_reenviar_falhas"):
+            reenviar_falhas(st.session_state.get('user_id'))
+            st.rerun()
+    with falha_col2:
+        if st.button("Descartar", key="btn_descartar_falhas"):
+            descartar_falhas(st.session_state.get('user_id'))
+            st.rerun()
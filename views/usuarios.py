@@ -18,18 +18,52 @@ tab1, tab2 = st.tabs(["Usuários Cadastrados", "Novo Usuário"])
 with tab1:
     st.subheader("Usuários Cadastrados")
     
+    # Busca e filtros (aplicados no servidor)
+    flt_col1, flt_col2, flt_col3, flt_col4 = st.columns([3, 1, 1, 1])
+    with flt_col1:
+        busca = st.text_input("Buscar por nome, usuário ou email", key="usuarios_busca")
+    with flt_col2:
+        perfil_filtro = st.selectbox("Perfil", options=[None, "admin", "user"], key="usuarios_perfil",
+                                     format_func=lambda x: "Todos" if x is None else ("Administrador" if x == "admin" else "Usuário comum"))
+    with flt_col3:
+        confirmado_filtro = st.selectbox("Status", options=[None, True, False], key="usuarios_status",
+                                         format_func=lambda x: "Todos" if x is None else ("Confirmado" if x else "Pendente"))
+    with flt_col4:
+        por_pagina = st.selectbox("Por página", options=[25, 50, 100], index=1, key="usuarios_por_pagina")
+    
+    # Voltar para a primeira página quando a busca ou os filtros mudarem
+    filtros = (busca, perfil_filtro, confirmado_filtro, por_pagina)
+    if st.session_state.get('usuarios_filtros') != filtros:
+        st.session_state.usuarios_filtros = filtros
+        st.session_state.usuarios_pagina = 1
+    pagina = st.session_state.get('usuarios_pagina', 1)
+    
     # Botão para atualizar a lista
     if st.button("Atualizar Lista", key="btn_atualizar_usuarios"):
-        st.session_state.usuarios_cache = supabase_client.listar_usuarios()  # Limpar o cache
+        st.session_state.usuarios_cache = None  # Limpar o cache
         st.rerun()
     
-    # Carregar usuários (com cache)
-    if 'usuarios_cache' not in st.session_state:
+    # Carregar só a página atual (com cache por página e filtros)
+    parametros = (pagina,) + filtros
+    cache = st.session_state.get('usuarios_cache')
+    if not cache or cache['parametros'] != parametros:
         with st.spinner("Carregando usuários..."):
-            st.session_state.usuarios_cache = supabase_client.listar_usuarios()
+            try:
+                usuarios, total = supabase_client.listar_usuarios(
+                    pagina=pagina,
+                    por_pagina=por_pagina,
+                    busca=busca,
+                    perfil=perfil_filtro,
+                    confirmado=confirmado_filtro
+                )
+            except Exception as e:
+                st.error(f"Erro ao listar usuários: {str(e)}")
+                usuarios, total = [], 0
+        cache = {"parametros": parametros, "usuarios": usuarios, "total": total}
+        st.session_state.usuarios_cache = cache
     
     # Mostrar a lista de usuários
-    if st.session_state.usuarios_cache:
+    if cache['usuarios']:
         usuarios_df = {
             "Nome": [],
             "Usuário": [],
@@ -38,7 +72,7 @@ with tab1:
             "Status": [],
         }
         
-        for user in st.session_state.usuarios_cache:
+        for user in cache['usuarios']:
             usuarios_df["Nome"].append(user["nome"])
             usuarios_df["Usuário"].append(user["username"])
             usuarios_df["Email"].append(user["email"])
@@ -49,6 +83,25 @@ with tab1:
         st.dataframe(usuarios_df, use_container_width=True)
     else:
         st.info("Nenhum usuário encontrado.")
+    
+    # Navegação entre páginas
+    total = cache['total']
+    total_paginas = max(1, -(-total // por_pagina)) if total is not None else None
+    tem_proxima = pagina < total_paginas if total_paginas else len(cache['usuarios']) == por_pagina
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("← Anterior", key="btn_usuarios_anterior", disabled=pagina <= 1):
+            st.session_state.usuarios_pagina = pagina - 1
+            st.rerun()
+    with nav_col2:
+        if total is not None:
+            st.write(f"Página {pagina} de {total_paginas} ({total} usuários)")
+        else:
+            st.write(f"Página {pagina}")
+    with nav_col3:
+        if st.button("Próxima →", key="btn_usuarios_proxima", disabled=not tem_proxima):
+            st.session_state.usuarios_pagina = pagina + 1
+            st.rerun()
 
 # Aba de novo usuário
 with tab2: